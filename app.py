@@ -1,5 +1,5 @@
 # Core Flask
-from flask import Flask, request, session, g
+from flask import Flask, request, session, g, current_app
 from flask_migrate import Migrate
 
 # Extensions
@@ -9,127 +9,27 @@ from flask.cli import with_appcontext
 
 # Local imports
 from config import Config
-from database import db, User
+from database import db, User, Character, NPC, load_principal, add_missing_columns, create_missing_indexes
 from auth import auth_bp
 from game import game_bp
 import os
 import click
-import json
 from flask_caching import Cache
 from cache_helpers import cache  # Add this import
+from translations import catalog
+from factions import faction_registry
+from presence import presence
+from cooldowns import pair_cooldowns
+from jails import jail_gate
 from tasks import init_scheduler
 
-def load_faction_stats(app):
-    config_path = os.path.join(app.root_path, 'config', 'factions.json')
-    try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)['factions']
-    except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
-        app.logger.error(f"Failed to load faction stats: {str(e)}")
-        return {}
-
-def load_translation_file(lang):
-    translations = {
-        'general': {},
-        'auth': {},
-        'errors': {},
-        'forms': {},
-        'navigation': {},
-        'game': {
-            'items': {
-                'weapon': {},
-                'armor': {
-                    'head': {},
-                    'body': {},
-                    'gloves': {},
-                    'pants': {},
-                    'boots': {}
-                },
-                'magic': {}
-            },
-            'npcs': {},
-            'factions': {},
-            'attributes': {},
-            'academy': {},
-            'market': {},
-            'fights': {},
-            'arena': {},
-            'bank': {},
-            'mine': {},
-            'lottery': {},
-            'online': {},
-            'character_stats':{},
-            'buildings':[],
-            'quests': {
-				'attributes': {}
-			}
-        },
-        'dashboard': {},
-        'character_creation': {},
-        'authentication': {},
-        'lore': {},
-        'search': {},
-        'fight': {},
-        'rankings': {},
-        'shop': {},
-        'admin': {}
-    }
-
-    base_path = os.path.join('locales', lang)
-    
-    if not os.path.exists(base_path):
-        return translations
-    
-    general_path = os.path.join(base_path, 'general.json')
-    if os.path.exists(general_path):
-        with open(general_path, 'r', encoding='utf-8') as f:
-            translations['general'] = json.load(f)
-    
-    for filename in ['auth', 'errors', 'forms', 'navigation', 'dashboard', 
-                    'character_creation', 'authentication', 'lore', 'search',
-                    'fight', 'rankings', 'shop', 'admin']:
-        file_path = os.path.join(base_path, f"{filename}.json")
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                translations[filename] = json.load(f)
-    
-    game_path = os.path.join(base_path, 'game')
-    if os.path.exists(game_path):
-        # Load game items
-        items_path = os.path.join(game_path, 'items')
-        if os.path.exists(items_path):
-            weapon_path = os.path.join(items_path, 'weapons.json')
-            if os.path.exists(weapon_path):
-                with open(weapon_path, 'r', encoding='utf-8') as f:
-                    translations['game']['items']['weapon'] = json.load(f)
-            
-            armor_path = os.path.join(items_path, 'armor.json')
-            if os.path.exists(armor_path):
-                with open(armor_path, 'r', encoding='utf-8') as f:
-                    armor_data = json.load(f)
-                    for slot in ['head', 'body', 'gloves', 'pants', 'boots']:
-                        translations['game']['items']['armor'][slot] = armor_data.get(slot, {})
-        
-        for filename in ['npcs', 'factions', 'attributes', 'academy', 'market', 'fights', 'arena', 'lottery', 'mine', 'bank','quests']:
-            file_path = os.path.join(game_path, f"{filename}.json")
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    translations['game'][filename] = json.load(f)
-        
-        buildings_path = os.path.join(game_path, 'buildings.json')
-        if os.path.exists(buildings_path):
-            with open(buildings_path, 'r', encoding='utf-8') as f:
-                buildings_data = json.load(f)
-                translations['game']['buildings'] = buildings_data.get('buildings', [])
-        
-    
-    return translations
-
 @click.command('init-db')
 @with_appcontext
 def init_db_command():
     """Initialize the database tables."""
     db.create_all()
+    add_missing_columns()
+    create_missing_indexes()
     print("Database tables created.")
 
 @click.command('list-users')
@@ -154,6 +54,43 @@ def set_admin_command(username):
     db.session.commit()
     print(f"{username} is now an admin.")
 
+@click.command('simulate-fight')
+@click.argument('attacker')
+@click.argument('defender')
+@click.option('--npc', is_flag=True, help='DEFENDER is an NPC translation key')
+@click.option('-n', '--fights', default=100000, help='Number of fights to simulate')
+@click.option('--seed', type=int, default=None)
+@with_appcontext
+def simulate_fight_command(attacker, defender, npc, fights, seed):
+    """Estimate the odds of a fight between two characters, or a character and an NPC"""
+    from combat import Combatant
+    from simulation import simulate_pvp, simulate_npc
+    character = Character.query.filter_by(name=attacker).first()
+    if not character:
+        print(f"Character {attacker} not found!")
+        return
+    if npc:
+        opponent = NPC.query.filter_by(translation_key=defender).first()
+    else:
+        opponent = Character.query.filter_by(name=defender).first()
+    if not opponent:
+        print(f"{'NPC' if npc else 'Character'} {defender} not found!")
+        return
+    
+    if npc:
+        report = simulate_npc(Combatant.from_character(character), Combatant.from_npc(opponent),
+                              n=fights, seed=seed, max_rounds=current_app.config['FIGHT_MAX_ROUNDS'])
+    else:
+        report = simulate_pvp(Combatant.from_character(character), Combatant.from_character(opponent),
+                              n=fights, seed=seed, max_rounds=current_app.config['FIGHT_MAX_ROUNDS'])
+    
+    print(f"{attacker} vs {defender}: {report.fights} fights")
+    print(f"Win rate: {report.win_rate:.2%} ({report.wins} won, {report.losses} lost, {report.tiebreaks} on the round limit)")
+    for label, dist in (('Rounds', report.rounds), ('Damage dealt', report.damage_dealt),
+                        ('Damage taken', report.damage_taken)):
+        print(f"{label}: mean {dist['mean']:.1f}, p10 {dist['p10']:.0f}, median {dist['p50']:.0f}, "
+              f"p90 {dist['p90']:.0f}, max {dist['max']:.0f}")
+
 def create_app():
     app = Flask(__name__)
     app.config.from_object(Config)
@@ -161,26 +98,20 @@ def create_app():
     db.init_app(app)
     migrate = Migrate(app, db)
     babel = Babel(app)
-    cache.init_app(app, config={
-        'CACHE_TYPE': 'SimpleCache',
-        'CACHE_DEFAULT_TIMEOUT': 300
-    })
+    cache.init_app(app)  # backend chosen by CACHE_TYPE in Config
+    catalog.init_app(app)
     
-    with app.app_context():
-        config_path = os.path.join(app.root_path, 'config', 'factions.json')
-        try:
-            with open(config_path, 'r', encoding='utf-8') as f:
-                app.config['FACTION_STATS'] = json.load(f)['factions']
-        except (FileNotFoundError, json.JSONDecodeError) as e:
-            app.logger.error(f"Failed to load faction stats: {str(e)}")
-            app.config['FACTION_STATS'] = {}
+    faction_registry.init_app(app)
+    presence.init_app(app)
+    pair_cooldowns.init_app(app)
+    jail_gate.init_app(app)
     
     login_manager = LoginManager(app)
     login_manager.login_view = 'auth.login'
     
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        return load_principal(int(user_id))
     
     @app.context_processor
     def inject_user():
@@ -199,11 +130,12 @@ def create_app():
     app.cli.add_command(init_db_command)
     app.cli.add_command(list_users_command)
     app.cli.add_command(set_admin_command)
+    app.cli.add_command(simulate_fight_command)
     
     @app.before_request
     def load_translations():
         lang = session.get('language', app.config['DEFAULT_LANGUAGE'])
-        g.translations = load_translation_file(lang)
+        g.translations = catalog.get(lang)
         
     init_scheduler(app)
         
@@ -215,6 +147,8 @@ if __name__ == '__main__':
         scheduler = init_scheduler(app)
     with app.app_context():
         db.create_all()
+        add_missing_columns()
+        create_missing_indexes()
         admin = User.query.get(1)
         if admin and not admin.is_admin:
             admin.is_admin = True
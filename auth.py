@@ -8,112 +8,16 @@ from flask_login import login_user, logout_user, login_required, current_user
 from mastodon import Mastodon
 from datetime import datetime  # Add this with other imports
 from database import FediverseInstance  # Add this import
+from translations import catalog
 import urllib.parse
-import os
-import json
 
 NGROK_URL = "https://25c7-2804-868-d047-9519-74d7-52d7-f35b-2cae.ngrok-free.app"
 
 auth_bp = Blueprint('auth', __name__)
 
 def load_translations(lang):
-    """Load translations for the specified language"""
-    translations = {
-        'general': {},
-        'auth': {},
-        'errors': {},
-        'forms': {},
-        'navigation': {},
-        'game': {
-            'items': {
-                'weapon': {},
-                'armor': {
-                    'head': {},
-                    'body': {},
-                    'gloves': {},
-                    'pants': {},
-                    'boots': {}
-                },
-                'magic': {}
-            },
-            'npcs': {},
-            'factions': {},
-            'attributes': {},
-            'academy': {},
-            'market': {},
-            'fights': {},
-            'arena': {},
-            'bank': {},
-            'mine': {},
-            'lottery': {},
-            'character_stats': {},
-            'buildings': {},
-            'quests': {
-				'attributes': {}
-			}
-        },
-        'dashboard': {},
-        'character_creation': {},
-        'authentication': {},
-        'lore': {},
-        'search': {},
-        'fight': {},
-        'rankings': {},
-        'shop': {},
-        'admin': {}
-    }
-
-    base_path = os.path.join('locales', lang)
-    
-    if not os.path.exists(base_path):
-        return translations
-    
-    # Load general translations
-    general_path = os.path.join(base_path, 'general.json')
-    if os.path.exists(general_path):
-        with open(general_path, 'r', encoding='utf-8') as f:
-            translations['general'] = json.load(f)
-    
-    # Load other top-level files
-    for filename in ['auth', 'errors', 'forms', 'navigation', 'dashboard', 
-                    'character_creation', 'authentication', 'lore', 'search',
-                    'fight', 'rankings', 'shop', 'admin']:
-        file_path = os.path.join(base_path, f"{filename}.json")
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                translations[filename] = json.load(f)
-    
-    # Load game translations
-    game_path = os.path.join(base_path, 'game')
-    if os.path.exists(game_path):
-        # Load game items
-        items_path = os.path.join(game_path, 'items')
-        if os.path.exists(items_path):
-            weapon_path = os.path.join(items_path, 'weapons.json')
-            if os.path.exists(weapon_path):
-                with open(weapon_path, 'r', encoding='utf-8') as f:
-                    translations['game']['items']['weapon'] = json.load(f)
-            
-            armor_path = os.path.join(items_path, 'armor.json')
-            if os.path.exists(armor_path):
-                with open(armor_path, 'r', encoding='utf-8') as f:
-                    armor_data = json.load(f)
-                    for slot in ['head', 'body', 'gloves', 'pants', 'boots']:
-                        translations['game']['items']['armor'][slot] = armor_data.get(slot, {})
-            
-            magic_path = os.path.join(items_path, 'magic.json')
-            if os.path.exists(magic_path):
-                with open(magic_path, 'r', encoding='utf-8') as f:
-                    translations['game']['items']['magic'] = json.load(f)
-        
-        # Load other game files
-        for filename in ['npcs', 'factions', 'attributes', 'academy', 'market', 'fights', 'arena', 'lottery', 'mine', 'bank', 'quests']:
-            file_path = os.path.join(game_path, f"{filename}.json")
-            if os.path.exists(file_path):
-                with open(file_path, 'r', encoding='utf-8') as f:
-                    translations['game'][filename] = json.load(f)
-    
-    return translations
+    """Return the shared, read-only translations for the specified language"""
+    return catalog.get(lang)
 
 def get_current_language():
     """Get language from user preference, session, or default"""
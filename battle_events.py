@@ -0,0 +1,121 @@
+import base64
+import json
+import zlib
+from markupsafe import Markup
+from cache_helpers import cache
+
+EVENTS_VERSION = 1  # BattleLog.log holds the compressed events
+REPLAY_VERSION = 2  # BattleLog.log holds a seed and snapshots; see combat.replay_record
+REPLAY_CACHE_KEY = 'battle:replay:{}:{}'
+
+# Event codes; every event is (round, actor, code, value) where actor is the
+# subject of the line, 0 for the attacker of the fight and 1 for the defender
+HIT, CRIT, BLOCK, DODGE, HEAL, SKIP, TIMEOUT, DEFEAT = range(1, 9)
+
+DEFAULT_TEMPLATES = {
+    'hit': "{actor} {verb} {target} with {weapon} for <span class='damage'>{value} damage</span>!",
+    'crit': "{actor} {verb} {target} with {weapon} for <span class='crit'>{value} critical damage</span>!",
+    'block': "{actor} <span class='block'>{blocked}</span> {total} damage (reduced by {reduced})!",
+    'blocked': "blocked",
+    'partially_blocked': "partially blocked",
+    'dodge': "{actor} <span class='dodge'>dodged</span> {target}'s attack!",
+    'heal': "{actor} <span class='heal'>healed</span> for <span class='heal-amount'>{value} HP</span>!",
+    'skip': "... {value} more rounds ...",
+    'timeout': "After {value} rounds {actor} is left standing with more health!",
+    'defeat': "{actor} has defeated {target} and gained {value} XP!",
+    'strikes': "strikes",
+    'hits': "hits",
+    'unavailable': "This battle was fought under older rules and can no longer be replayed."
+}
+
+DEFAULT_NOTICE = {
+    'won': "You won the battle.",
+    'lost': "You lost the battle.",
+    'link': "View battle log"
+}
+
+def decode_log(stored):
+    """(events, weapons) of an encoded log, or None for logs saved as plain lines"""
+    if not isinstance(stored, dict) or stored.get('v') != EVENTS_VERSION:
+        return None
+    events = json.loads(zlib.decompress(base64.b64decode(stored['z'])))
+    return events, stored.get('w') or ['bare hands', 'bare hands']
+
+def replay_events(battle, timeout=3600):
+    """(events, weapons) of a battle stored as a replay record, or None if it can't be replayed.
+
+    The fight is played again at most once per ``timeout`` seconds.
+    """
+    record = battle.log
+    # The seed is part of the key so a reused row id never gets another battle's log
+    key = REPLAY_CACHE_KEY.format(battle.id, record.get('s'))
+    cached = cache.get(key)
+    if cached is None:
+        from combat import replay_pvp, snapshot_field
+        result = replay_pvp(record, battle.attacker_name, battle.defender_name)
+        if result is None:
+            cached = (None, None)
+        else:
+            cached = (result.events, (snapshot_field(record['a'], 'weapon_name'),
+                                      snapshot_field(record['d'], 'weapon_name')))
+        cache.set(key, cached, timeout=timeout)
+    events, weapons = cached
+    return None if events is None else (events, weapons)
+
+def _templates(translations):
+    text = dict(DEFAULT_TEMPLATES)
+    if translations:
+        text.update(translations.get('fight', {}).get('events', {}))
+    return text
+
+def render_events(events, names, weapons, translations=None):
+    """Log lines for a list of events, worded by the 'fight.events' catalog section"""
+    text = _templates(translations)
+    lines = []
+    for _, actor, code, value in events:
+        fields = {'actor': names[actor], 'target': names[1 - actor], 'value': value}
+        if code in (HIT, CRIT):
+            weapon = weapons[actor]
+            fields.update(weapon=weapon, verb=text['strikes'] if weapon != "bare hands" else text['hits'])
+            template = text['hit' if code == HIT else 'crit']
+        elif code == BLOCK:
+            damage, reduced = value
+            fields.update(total=damage + reduced, reduced=reduced,
+                          blocked=text['blocked' if damage == 0 else 'partially_blocked'])
+            template = text['block']
+        elif code == DODGE:
+            template = text['dodge']
+        elif code == HEAL:
+            template = text['heal']
+        elif code == SKIP:
+            template = text['skip']
+        elif code == TIMEOUT:
+            template = text['timeout']
+        elif code == DEFEAT:
+            template = text['defeat']
+        else:
+            continue
+        lines.append(Markup(template).format(**fields))
+    return lines
+
+def render_stored_log(battle, translations=None, timeout=3600):
+    """Log lines of a BattleLog row, whichever format it was saved in"""
+    stored = battle.log
+    if isinstance(stored, dict) and stored.get('v') == REPLAY_VERSION:
+        decoded = replay_events(battle, timeout)
+        if decoded is None:
+            return [Markup(_templates(translations)['unavailable'])]
+    else:
+        decoded = decode_log(stored)
+    if decoded is None:
+        return [Markup(entry) for entry in stored or []]
+    events, weapons = decoded
+    return render_events(events, (battle.attacker_name, battle.defender_name), weapons, translations)
+
+def render_notice(won, url, translations=None):
+    """Body of a battle notice message, worded by the 'fight.notice' catalog section"""
+    text = dict(DEFAULT_NOTICE)
+    if translations:
+        text.update(translations.get('fight', {}).get('notice', {}))
+    return Markup("{}\n\n<a href=\"{}\" class=\"text-blue-400 hover:text-blue-300\">{}</a>").format(
+        text['won' if won else 'lost'], url, text['link'])
@@ -0,0 +1,82 @@
+from datetime import datetime
+from database import BattleLog
+
+CURSOR_FORMAT = '%Y%m%d%H%M%S%f'
+
+def encode_cursor(battle):
+    return f"{battle.timestamp.strftime(CURSOR_FORMAT)}-{battle.id}"
+
+def decode_cursor(value):
+    """(timestamp, id) of a cursor, or None if it is missing or malformed"""
+    if not value:
+        return None
+    try:
+        stamp, battle_id = value.split('-')
+        return datetime.strptime(stamp, CURSOR_FORMAT), int(battle_id)
+    except ValueError:
+        return None
+
+class BattlePage:
+    """Battles of one history page, newest first, with cursors for the pages around it"""
+
+    __slots__ = ('items', 'newer', 'older')
+
+    def __init__(self, items, newer=None, older=None):
+        self.items = items
+        self.newer = newer
+        self.older = older
+
+    @property
+    def has_newer(self):
+        return self.newer is not None
+
+    @property
+    def has_older(self):
+        return self.older is not None
+
+def _side(column, character_id, cursor, older, limit):
+    query = BattleLog.query.filter(column == character_id)
+    if cursor:
+        stamp, battle_id = cursor
+        # The bare range on timestamp keeps the index seek; the OR only settles ties
+        if older:
+            query = query.filter(BattleLog.timestamp <= stamp,
+                                 (BattleLog.timestamp < stamp) | (BattleLog.id < battle_id))
+        else:
+            query = query.filter(BattleLog.timestamp >= stamp,
+                                 (BattleLog.timestamp > stamp) | (BattleLog.id > battle_id))
+    if older:
+        query = query.order_by(BattleLog.timestamp.desc(), BattleLog.id.desc())
+    else:
+        query = query.order_by(BattleLog.timestamp.asc(), BattleLog.id.asc())
+    return query.limit(limit).all()
+
+def battle_page(character_id, before=None, after=None, per_page=10):
+    """One page of a character's battles, older than ``before`` or newer than ``after``.
+
+    Each side of the fight is read from its own (participant, timestamp, id)
+    index, at most ``per_page + 1`` rows apiece, and the two runs are merged,
+    so a deep page costs the same as the first one.
+    """
+    older = not after
+    cursor = decode_cursor(before if older else after)
+    rows = {}
+    for column in (BattleLog.attacker_id, BattleLog.defender_id):
+        for battle in _side(column, character_id, cursor, older, per_page + 1):
+            rows[battle.id] = battle
+    battles = sorted(rows.values(), key=lambda b: (b.timestamp, b.id), reverse=older)
+    more = len(battles) > per_page
+    battles = battles[:per_page]
+
+    if older:
+        has_newer, has_older = cursor is not None, more
+    else:
+        if not battles:
+            return battle_page(character_id, per_page=per_page)
+        battles.reverse()
+        has_newer, has_older = more, True
+    if not battles:
+        return BattlePage([])
+    return BattlePage(battles,
+                      newer=encode_cursor(battles[0]) if has_newer else None,
+                      older=encode_cursor(battles[-1]) if has_older else None)
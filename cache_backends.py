@@ -0,0 +1,128 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from flask_caching.backends.base import BaseCache
+
+class SQLiteCache(BaseCache):
+    """Flask-Caching backend stored in a single SQLite file.
+
+    Every worker process that points at the same file shares one cache, so
+    rankings and other snapshots are built once per deployment instead of
+    once per worker, without running a separate cache server. ``add`` is a
+    single atomic upsert, which keeps the rebuild locks in cache_helpers
+    safe across processes.
+
+    Enable it with ``CACHE_TYPE = 'cache_backends.SQLiteCache'`` and point
+    ``CACHE_DIR`` at a directory writable by every worker.
+    """
+
+    FILENAME = 'cache.sqlite'
+
+    def __init__(self, path, default_timeout=300, threshold=5000):
+        super().__init__(default_timeout=default_timeout)
+        self.path = path
+        self.threshold = threshold
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS cache '
+                         '(key TEXT PRIMARY KEY, value BLOB, expires REAL NOT NULL)')
+
+    @classmethod
+    def factory(cls, app, config, args, kwargs):
+        cache_dir = config.get('CACHE_DIR') or os.path.join(app.instance_path, 'cache')
+        kwargs.update(threshold=config.get('CACHE_THRESHOLD') or 5000)
+        return cls(os.path.join(cache_dir, cls.FILENAME), *args, **kwargs)
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _expires(self, timeout):
+        timeout = self._normalize_timeout(timeout)
+        return time.time() + timeout if timeout > 0 else 0
+
+    def _prune(self, conn):
+        if not self.threshold:
+            return
+        now = time.time()
+        conn.execute('DELETE FROM cache WHERE expires != 0 AND expires <= ?', (now,))
+        count = conn.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self.threshold:
+            # Drop the entries closest to expiring; permanent ones go last
+            conn.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                         'ORDER BY expires = 0, expires LIMIT ?)', (count - self.threshold,))
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)',
+            (key, time.time())).fetchone()
+        if row is None:
+            return None
+        try:
+            return pickle.loads(row[0])
+        except (pickle.PickleError, EOFError, AttributeError, ImportError):
+            return None
+
+    def set(self, key, value, timeout=None):
+        conn = self._connection()
+        conn.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                     (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires(timeout)))
+        self._writes += 1
+        if self._writes % 100 == 0:
+            self._prune(conn)
+        return True
+
+    def add(self, key, value, timeout=None):
+        """Store ``value`` only if ``key`` is missing or expired; atomic across processes"""
+        cursor = self._connection().execute(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires = excluded.expires '
+            'WHERE cache.expires != 0 AND cache.expires <= ?',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), self._expires(timeout), time.time()))
+        return cursor.rowcount == 1
+
+    def inc(self, key, delta=1):
+        """Add ``delta`` to a stored integer inside one write transaction; atomic across processes"""
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value, expires FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)',
+                (key, time.time())).fetchone()
+            value = (pickle.loads(row[0]) if row else 0) + delta
+            conn.execute('INSERT OR REPLACE INTO cache (key, value, expires) VALUES (?, ?, ?)',
+                         (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+                          row[1] if row else self._expires(None)))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return value
+
+    def dec(self, key, delta=1):
+        return self.inc(key, -delta)
+
+    def delete(self, key):
+        cursor = self._connection().execute('DELETE FROM cache WHERE key = ?', (key,))
+        return cursor.rowcount == 1
+
+    def has(self, key):
+        row = self._connection().execute(
+            'SELECT 1 FROM cache WHERE key = ? AND (expires = 0 OR expires > ?)',
+            (key, time.time())).fetchone()
+        return row is not None
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+        return True
@@ -1,48 +1,48 @@
 from flask_caching import Cache
 from datetime import datetime
+from factions import faction_registry, faction_key
+import threading
+import time
+import uuid
 
 
 # Initialize empty cache that will be configured later
 cache = Cache()
 
-def get_cached_rankings():
+RANKINGS_SNAPSHOT_KEY = 'rankings:snapshot'
+RANKINGS_FRESH_KEY = 'rankings:fresh'
+RANKINGS_GENERATION_KEY = 'rankings:generation'
+RANKINGS_LOCK_KEY = 'rankings:rebuild-lock'
+RANKINGS_LOCK_TIMEOUT = 60
+RANKINGS_WAIT_SECONDS = 5  # How long a cold-cache reader waits for another's rebuild
+RANKINGS_POLL_INTERVAL = 0.05
+RANKINGS_TOKEN_KEY = 'rankings:token'
+RANKINGS_THROTTLE_KEY = 'rankings:throttle'
+RANKINGS_DIRTY_KEY = 'rankings:dirty'
+
+SIDEBAR_GLOBALS_KEY = 'sidebar:globals'
+
+FACTION_TOTAL_KEY = 'factions:{}:{}'
+FACTION_TOTAL_FIELDS = ('kills', 'deaths', 'count')
+
+# Last snapshot this process decoded, so a hit doesn't unpickle the whole board
+_local_rankings = {'token': None, 'data': None}
+
+def build_rankings():
     """Central function for all ranking calculations"""
-    from database import Character
     from flask import current_app
-    from collections import defaultdict
+    from leaderboards import BOARDS, query_top
     
     now = datetime.utcnow()
     
     with current_app.app_context():
-        # Get all character data
-        chars = Character.query.all()
-        
-        # Individual player rankings
-        player_data = [{
-            'id': c.id,
-            'name': c.name,
-            'level': c.level,
-            'current_xp': c.current_xp,
-            'pvp_kills': c.pvp_kills,
-            'deaths': c.deaths if hasattr(c, 'deaths') else 0,
-            'reputation': c.reputation if hasattr(c, 'reputation') else 0,
-            'faction': c.faction,
-            'faction_color': get_faction_color(c.faction),
-            'faction_image': f"{c.faction.lower()}.webp",
-            'gold': c.gold,
-            'bank_gold': c.bank_gold,
-            'mining_level': c.mining_level,
-            'diamonds': c.diamonds
-            
-        } for c in chars]
+        # The snapshot is shared by every worker, so it is read from the database
+        # rather than this process's leaderboard index; only the top of each board is kept
+        top_n = current_app.config.get('RANKINGS_TOP_N', 10)
+        rankings = {board: query_top(board, top_n) for board in BOARDS}
         
         # Faction statistics
-        faction_stats = defaultdict(lambda: {'kills': 0, 'deaths': 0, 'count': 0})
-        for char in chars:
-            faction = char.faction
-            faction_stats[faction]['kills'] += char.pvp_kills
-            faction_stats[faction]['deaths'] += char.deaths if hasattr(char, 'deaths') else 0
-            faction_stats[faction]['count'] += 1
+        faction_stats = get_faction_totals()
         
         # Convert to list and sort
         faction_data = [{
@@ -51,22 +51,10 @@ def get_cached_rankings():
             'deaths': stats['deaths'],
             'count': stats['count'],
             'color': get_faction_color(faction),
-            'image': f"{faction.lower()}.webp"
+            'image': faction_registry.image(faction)
         } for faction, stats in faction_stats.items()]
         
-        return {
-            # Player rankings
-            'xp': sorted(player_data, key=lambda x: (-x['current_xp'], x['name'])),
-            'level': sorted(player_data, key=lambda x: (-x['level'], x['name'])),
-            'kills': sorted(player_data, key=lambda x: (-x['pvp_kills'], x['name'])),
-            'deaths': sorted(player_data, key=lambda x: (-x['deaths'], x['name'])),
-            'reputation': sorted(player_data, key=lambda x: (-x['reputation'], x['name'])),
-            'worst_reputation': sorted(player_data, key=lambda x: (x['reputation'], x['name'])),
-            'gold': sorted(player_data, key=lambda x: (-x['gold'], x['name'])),
-            'bank_gold': sorted(player_data, key=lambda x: (-x['bank_gold'], x['name'])),
-            'mining_level': sorted(player_data, key=lambda x: (-x['mining_level'], x['name'])),
-            'diamonds': sorted(player_data, key=lambda x: (-x['diamonds'], x['name'])),
-            
+        rankings.update({
             # Faction rankings
             'faction_kills': sorted(faction_data, key=lambda x: -x['kills']),
             'faction_deaths': sorted(faction_data, key=lambda x: -x['deaths']),
@@ -74,18 +62,268 @@ def get_cached_rankings():
             'faction_pie': faction_data,  # For the pie chart
             
             'timestamp': now
-        }
+        })
+        return rankings
+
+def _rankings_ttl():
+    from flask import current_app
+    return current_app.config.get('RANKINGS_CACHE_TTL', 300)
+
+def _refresh_interval():
+    from flask import current_app
+    return current_app.config.get('RANKINGS_REFRESH_INTERVAL', 30)
+
+def _flush_pending_refresh():
+    """Apply a coalesced refresh once its interval has run out"""
+    if cache.get(RANKINGS_DIRTY_KEY) and cache.add(RANKINGS_THROTTLE_KEY, True, timeout=_refresh_interval()):
+        cache.delete(RANKINGS_DIRTY_KEY)
+        invalidate_rankings_cache()
+
+def _rebuild_rankings(app=None):
+    """Rebuild the snapshot; only ever run by the holder of the rebuild lock"""
+    from flask import current_app
+    app = app or current_app._get_current_object()
+    with app.app_context():
+        try:
+            generation = cache.get(RANKINGS_GENERATION_KEY)
+            data = build_rankings()
+            token = uuid.uuid4().hex
+            cache.set(RANKINGS_SNAPSHOT_KEY, (token, data), timeout=0)
+            cache.set(RANKINGS_TOKEN_KEY, token, timeout=0)
+            _local_rankings.update(token=token, data=data)
+            # Only mark it fresh if nothing was invalidated while we were building
+            if cache.get(RANKINGS_GENERATION_KEY) == generation:
+                cache.set(RANKINGS_FRESH_KEY, True, timeout=_rankings_ttl())
+            return data
+        finally:
+            cache.delete(RANKINGS_LOCK_KEY)
+
+def _load_snapshot():
+    token = cache.get(RANKINGS_TOKEN_KEY)
+    if token is None:
+        return None
+    if _local_rankings['token'] != token:
+        snapshot = cache.get(RANKINGS_SNAPSHOT_KEY)
+        if snapshot is None:
+            return None
+        _local_rankings.update(token=snapshot[0], data=snapshot[1])
+    return _local_rankings['data']
+
+def _wait_for_rebuild():
+    """Poll for the snapshot another reader is building; only build it here as a last resort"""
+    deadline = time.monotonic() + RANKINGS_WAIT_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(RANKINGS_POLL_INTERVAL)
+        data = _load_snapshot()
+        if data is not None:
+            return data
+    return build_rankings()
+
+def get_cached_rankings():
+    """Cached rankings snapshot with stale-while-revalidate.
+
+    A fresh snapshot is returned straight from the cache. A stale one is
+    still returned immediately, while a single background thread (the one
+    that wins the rebuild lock) recomputes it for everyone else. With no
+    snapshot at all, readers that lose the lock wait for the winner's.
+    """
+    from flask import current_app
+
+    _flush_pending_refresh()
+    data = _load_snapshot()
+    if data is not None and cache.get(RANKINGS_FRESH_KEY):
+        return data
+
+    if not cache.add(RANKINGS_LOCK_KEY, True, timeout=RANKINGS_LOCK_TIMEOUT):
+        # Somebody else is already rebuilding
+        return data if data is not None else _wait_for_rebuild()
+
+    if data is None:
+        return _rebuild_rankings()
+
+    app = current_app._get_current_object()
+    threading.Thread(target=_rebuild_rankings, args=(app,), daemon=True).start()
+    return data
 
 def get_faction_color(faction):
     """Helper to get faction color from your config"""
-    color_map = {
-        'veylan': '#6c3e8d',
-        'urghan': '#87563e',
-        'aureen': '#0a3e8d',
-        'camyra': '#25743e'
-    }
-    return color_map.get(faction.lower(), '#cccccc')
+    return faction_registry.color(faction)
 
 def invalidate_rankings_cache():
     """Call this after any character stat changes"""
-    cache.delete_memoized(get_cached_rankings)
+    cache.set(RANKINGS_GENERATION_KEY, uuid.uuid4().hex, timeout=0)
+    cache.delete(RANKINGS_FRESH_KEY)
+
+def request_rankings_refresh():
+    """Coalesced invalidate_rankings_cache, at most once per RANKINGS_REFRESH_INTERVAL.
+
+    The first change in an interval invalidates straight away; later ones
+    only mark the snapshot dirty, and the next reader after the interval
+    expires flushes them as a single refresh.
+    """
+    interval = _refresh_interval()
+    if interval <= 0 or cache.add(RANKINGS_THROTTLE_KEY, True, timeout=interval):
+        invalidate_rankings_cache()
+    else:
+        cache.set(RANKINGS_DIRTY_KEY, True, timeout=0)
+
+def unread_count_key(character_id):
+    return f'sidebar:unread:{character_id}'
+
+def _build_sidebar_globals():
+    """The parts of the sidebar that are the same for every player"""
+    from database import Character
+    from presence import presence
+    online_count = presence.online_count()
+    recent_players = Character.query \
+        .order_by(Character.created_at.desc()) \
+        .limit(3) \
+        .all()
+    return {
+        'online_count': online_count,
+        'recent_players': [{
+            'id': char.id,
+            'name': char.name,
+            'level': char.level,
+            'faction': char.faction
+        } for char in recent_players]
+    }
+
+def _count_unread(character_id):
+    from database import Message
+    return Message.query.filter(
+        Message.recipient_id == character_id,
+        Message.is_read == False,
+        Message.expires_at > datetime.utcnow()
+    ).count()
+
+def get_sidebar_snapshot(character_id=None):
+    """Shared sidebar data plus the character's unread count, in one cache round trip.
+
+    The shared part expires after SIDEBAR_CACHE_TTL. Unread counts are
+    counted once, then kept current by the Message commit hooks in
+    database.py (see adjust_unread_counts).
+    """
+    from flask import current_app
+    unread_key = unread_count_key(character_id) if character_id else None
+    keys = [SIDEBAR_GLOBALS_KEY] + ([unread_key] if unread_key else [])
+    values = cache.get_many(*keys)
+
+    snapshot = values[0]
+    if snapshot is None:
+        snapshot = _build_sidebar_globals()
+        cache.set(SIDEBAR_GLOBALS_KEY, snapshot, timeout=current_app.config.get('SIDEBAR_CACHE_TTL', 30))
+
+    unread = 0
+    if unread_key:
+        unread = values[1]
+        if unread is None:
+            unread = _count_unread(character_id)
+            cache.set(unread_key, unread, timeout=0)
+
+    return dict(snapshot, unread_message_count=unread)
+
+def invalidate_sidebar_globals():
+    cache.delete(SIDEBAR_GLOBALS_KEY)
+
+def adjust_unread_counts(deltas):
+    """Apply committed {character_id: +/-n} unread changes to the cached counters.
+
+    The backend's inc is a single atomic update on the shared backends, so
+    concurrent workers don't lose each other's changes.
+    """
+    for character_id, delta in deltas.items():
+        if not delta:
+            continue
+        key = unread_count_key(character_id)
+        value = cache.cache.inc(key, delta)
+        # inc starts a missing counter at zero; drop it (and anything that went
+        # negative) so the next read counts from the database instead
+        if value is None or value == delta or value < 0:
+            cache.delete(key)
+
+def reconcile_unread_counts():
+    """Recount unread messages and fix cached counters that drifted; returns how many"""
+    from database import db, Character, Message
+    counts = dict(db.session.query(Message.recipient_id, db.func.count(Message.id)).filter(
+        Message.is_read == False,
+        Message.expires_at > datetime.utcnow()
+    ).group_by(Message.recipient_id).all())
+    character_ids = [character_id for character_id, in db.session.query(Character.id)]
+    if not character_ids:
+        return 0
+    
+    cached = cache.get_many(*[unread_count_key(i) for i in character_ids])
+    fixed = {unread_count_key(i): counts.get(i, 0)
+             for i, value in zip(character_ids, cached)
+             if value is not None and value != counts.get(i, 0)}
+    if fixed:
+        cache.set_many(fixed, timeout=0)
+    return len(fixed)
+
+def faction_total_key(faction, field):
+    return FACTION_TOTAL_KEY.format(faction_key(faction), field)
+
+def _count_faction_totals():
+    """{faction key: {'kills', 'deaths', 'count'}} for every registered faction"""
+    from leaderboards import query_faction_totals
+    totals = {faction.key: dict.fromkeys(FACTION_TOTAL_FIELDS, 0) for faction in faction_registry}
+    for faction, stats in query_faction_totals().items():
+        key = faction_key(faction)
+        if key in totals:
+            for field in FACTION_TOTAL_FIELDS:
+                totals[key][field] += stats[field]
+    return totals
+
+def _faction_total_values(totals):
+    return {FACTION_TOTAL_KEY.format(key, field): stats[field]
+            for key, stats in totals.items() for field in FACTION_TOTAL_FIELDS}
+
+def get_faction_totals():
+    """{faction name: {'kills', 'deaths', 'count'}} for factions with members.
+
+    Counted with one GROUP BY when a counter is missing, then kept current by
+    the Character commit hooks in database.py (see adjust_faction_totals), so
+    a rankings rebuild reads them in one cache round trip.
+    """
+    factions = list(faction_registry)
+    keys = [FACTION_TOTAL_KEY.format(faction.key, field)
+            for faction in factions for field in FACTION_TOTAL_FIELDS]
+    values = cache.get_many(*keys)
+    if any(value is None for value in values):
+        totals = _count_faction_totals()
+        cache.set_many(_faction_total_values(totals), timeout=0)
+    else:
+        fields = iter(values)
+        totals = {faction.key: {field: next(fields) for field in FACTION_TOTAL_FIELDS}
+                  for faction in factions}
+    return {faction.name: totals[faction.key] for faction in factions
+            if totals[faction.key]['count'] > 0}
+
+def adjust_faction_totals(deltas, stale=()):
+    """Apply committed {(faction, field): +/-n} changes to the cached faction counters.
+
+    Factions in ``stale`` had a change whose old value wasn't loaded; their
+    counters are dropped so the next read recounts them.
+    """
+    for (faction, field), delta in deltas.items():
+        if not delta or faction in stale:
+            continue
+        key = faction_total_key(faction, field)
+        value = cache.cache.inc(key, delta)
+        # Same rule as the unread counters: never trust a counter inc had to create
+        if value is None or value == delta or value < 0:
+            cache.delete(key)
+    for faction in stale:
+        cache.delete_many(*[faction_total_key(faction, field) for field in FACTION_TOTAL_FIELDS])
+
+def reconcile_faction_totals():
+    """Recount faction totals and fix cached counters that drifted; returns how many"""
+    counts = _faction_total_values(_count_faction_totals())
+    keys = list(counts)
+    cached = cache.get_many(*keys)
+    fixed = {key: counts[key] for key, value in zip(keys, cached)
+             if value is not None and value != counts[key]}
+    if fixed:
+        cache.set_many(fixed, timeout=0)
+    return len(fixed)
@@ -0,0 +1,355 @@
+import random
+from datetime import datetime
+from factions import faction_registry
+from battle_events import HIT, CRIT, BLOCK, DODGE, HEAL, SKIP, TIMEOUT, DEFEAT
+from dice import DiceSpec
+
+# Bump whenever resolve_pvp would play out the same seed differently, so
+# stored battles from older rules are not replayed with the new ones
+ENGINE_VERSION = 1
+
+# Layout of a stored snapshot; battles saved before the derived values were
+# kept hold a plain list in this order
+SNAPSHOT_FIELDS = ('faction', 'level', 'forca', 'destreza', 'inteligencia', 'devocao', 'hp',
+                   'max_hp', 'defense', 'weapon_dice', 'weapon_name', 'gold')
+# Worked out from config/factions.json; stored so editing it doesn't change old replays
+DERIVED_FIELDS = ('power', 'is_urghan', 'is_veylan', 'is_aureen', 'is_camyra')
+
+class Combatant:
+    """Plain snapshot of everything a fight reads from one character"""
+
+    __slots__ = ('id', 'name', 'faction', 'level', 'forca', 'destreza', 'inteligencia',
+                 'devocao', 'power', 'hp', 'max_hp', 'defense', 'weapon_dice', 'weapon_name',
+                 'gold', 'is_urghan', 'is_veylan', 'is_aureen', 'is_camyra')
+
+    def __init__(self, id, name, faction, level, forca, destreza, inteligencia, devocao,
+                 hp, max_hp, defense=0, weapon_dice=None, weapon_name="bare hands", gold=0):
+        self.id = id
+        self.name = name
+        self.faction = faction
+        self.level = level
+        self.forca = forca
+        self.destreza = destreza
+        self.inteligencia = inteligencia
+        self.devocao = devocao
+        self.hp = hp
+        self.max_hp = max_hp
+        self.defense = defense
+        self.weapon_dice = weapon_dice
+        self.weapon_name = weapon_name
+        self.gold = gold
+        self.is_urghan = faction_registry.matches(faction, 'urghan')
+        self.is_veylan = faction_registry.matches(faction, 'veylan')
+        self.is_aureen = faction_registry.matches(faction, 'aureen')
+        self.is_camyra = faction_registry.matches(faction, 'camyra')
+        self.power = player_power(faction, forca, destreza, inteligencia, devocao)
+
+    @classmethod
+    def from_character(cls, character):
+        stats = character.combat_stats
+        return cls(
+            id=character.id,
+            name=character.name,
+            faction=character.faction,
+            level=character.level,
+            forca=character.forca,
+            destreza=character.destreza,
+            inteligencia=character.inteligencia,
+            devocao=character.devocao,
+            hp=character.healthpoints,
+            max_hp=character.max_healthpoints,
+            defense=stats.defense,
+            weapon_dice=stats.weapon_dice,
+            weapon_name=stats.weapon_name,
+            gold=character.gold
+        )
+
+    @classmethod
+    def from_npc(cls, npc):
+        weapon_dice = None
+        weapon_name = "bare hands"
+        if npc.weapon and npc.weapon.dice:
+            weapon_dice = npc.weapon.dice
+            weapon_name = npc.weapon.translation_key.replace('_', ' ').title()
+        defense = 0
+        if npc.armor and 'defense' in npc.armor.stats:
+            defense = npc.armor.stats['defense']
+        return cls(
+            id=npc.id,
+            name=npc.translation_key,
+            faction=npc.faction,
+            level=npc.level,
+            forca=npc.forca,
+            destreza=npc.destreza,
+            inteligencia=npc.inteligencia,
+            devocao=npc.devocao,
+            hp=npc.healthpoints,
+            max_hp=npc.max_healthpoints,
+            defense=defense,
+            weapon_dice=weapon_dice,
+            weapon_name=weapon_name
+        )
+
+    def snapshot(self):
+        """Everything resolve_pvp reads except id and name, as a JSON-friendly dict"""
+        data = {field: getattr(self, field) for field in SNAPSHOT_FIELDS + DERIVED_FIELDS}
+        data['weapon_dice'] = list(self.weapon_dice) if self.weapon_dice else None
+        return data
+
+    @classmethod
+    def from_snapshot(cls, id, name, data):
+        if isinstance(data, list):
+            data = dict(zip(SNAPSHOT_FIELDS, data))
+        fields = {field: data[field] for field in SNAPSHOT_FIELDS}
+        weapon_dice = fields.pop('weapon_dice')
+        combatant = cls(id, name, weapon_dice=DiceSpec(*weapon_dice) if weapon_dice else None, **fields)
+        for field in DERIVED_FIELDS:
+            if field in data:
+                setattr(combatant, field, data[field])
+        return combatant
+
+def snapshot_field(data, field):
+    """One field of a stored snapshot, whichever layout it was saved in"""
+    if isinstance(data, list):
+        return data[SNAPSHOT_FIELDS.index(field)]
+    return data[field]
+
+class FightResult:
+    """Outcome of resolve_pvp, applied to the database rows by apply_pvp_result"""
+
+    __slots__ = ('attacker_won', 'attacker_hp', 'defender_hp', 'xp', 'gold',
+                 'attacker_rep_change', 'defender_rep_change', 'rounds', 'timed_out', 'events')
+
+    def __init__(self):
+        self.attacker_won = False
+        self.attacker_hp = 0
+        self.defender_hp = 0
+        self.xp = 0
+        self.gold = 0
+        self.attacker_rep_change = 0
+        self.defender_rep_change = 0
+        self.rounds = 0
+        self.timed_out = False
+        self.events = []  # (round, actor, code, value); see battle_events
+
+def player_power(faction, forca, destreza, inteligencia, devocao):
+    """0.75 x the faction's main stat plus 0.35 x the other three"""
+    main_stat_name = faction_registry.main_stat(faction)
+    main_stat = {'forca': forca, 'destreza': destreza, 'inteligencia': inteligencia,
+                 'devocao': devocao}.get(main_stat_name, 0)
+    other_stats = forca + destreza + inteligencia + devocao - main_stat
+    return (0.75 * main_stat) + (0.35 * other_stats)
+
+def defense_chance(attacker, defender):
+    base_chance = 15 if defender.is_urghan else 5
+
+    if attacker.forca > defender.forca:
+        base_chance = 10
+    elif attacker.forca == defender.forca:
+        base_chance = 15 if defender.is_urghan else 5
+
+    str_diff_bonus = (abs(attacker.forca - defender.forca) // 10) * 2
+    str_diff_bonus = min(str_diff_bonus, 40 if defender.is_urghan else 25)
+
+    if defender.forca > attacker.forca:
+        base_chance += str_diff_bonus
+    else:
+        base_chance -= str_diff_bonus
+
+    return max(0, min(base_chance, 95))
+
+def dodge_chance(character, opponent):
+    base_chance = 10 if character.is_veylan else 5
+
+    dex_diff = character.destreza - opponent.destreza
+    if dex_diff > 0:
+        base_chance += min((dex_diff // 10) * 2, 40 if character.is_veylan else 25)
+
+    return max(0, min(base_chance, 95))
+
+def crit_chance(character, opponent):
+    base_chance = 10 if character.is_aureen else 5
+
+    int_diff = character.inteligencia - opponent.inteligencia
+    if int_diff > 0:
+        base_chance += 5
+        int_diff_bonus = (int_diff // 10) * (1 if character.is_aureen else 0.5)
+        base_chance += min(int_diff_bonus, 25 if character.is_aureen else 20)
+
+    return max(0, min(base_chance, 95))
+
+def heal_chance(character, opponent):
+    base_chance = 10 if character.is_camyra else 2
+
+    dev_diff = character.devocao - opponent.devocao
+    if dev_diff > 0:
+        base_chance += 5
+        dev_diff_bonus = (dev_diff // 10) * (1 if character.is_camyra else 0.5)
+        base_chance += min(dev_diff_bonus, 30 if character.is_camyra else 20)
+
+    return max(0, min(base_chance, 95))
+
+def roll_weapon(combatant, rng):
+    if not combatant.weapon_dice:
+        return 0
+    return combatant.weapon_dice.roll(rng)
+
+def reputation_changes(attacker, defender, attacker_won):
+    """(attacker, defender) reputation deltas for a finished PvP fight"""
+    if attacker.faction == defender.faction:
+        return (-4, 0) if attacker_won else (-4, 4)
+    if faction_registry.is_enemy(attacker.faction, defender.faction):
+        return (3, -3) if attacker_won else (-3, 3)
+    return (1, -1) if attacker_won else (-1, 1)
+
+def hp_ratio(combatant):
+    return combatant.hp / combatant.max_hp if combatant.max_hp else 0
+
+def tiebreak_loser(attacker, defender):
+    """Loser of a fight that ran out of rounds: the lower share of HP left, the attacker on a tie"""
+    return defender if hp_ratio(attacker) > hp_ratio(defender) else attacker
+
+def resolve_pvp(attacker, defender, rng=random, max_rounds=None, log_rounds=None):
+    """Fight two Combatants to the death; returns a FightResult.
+
+    Works only on the snapshots and ``rng`` (anything with ``random`` and
+    ``randint``), so it never touches the database. The log is kept as
+    battle_events tuples and only turned into text when it is shown.
+
+    After ``max_rounds`` swings the fight is settled by tiebreak_loser.
+    Only the first ``log_rounds`` swings are logged; the rest are summed
+    up in a single SKIP event.
+    """
+    result = FightResult()
+    events = result.events
+    side = {attacker: 0, defender: 1}
+
+    # Every chance only depends on who is swinging, so work them out once
+    other = {attacker: defender, defender: attacker}
+    dodge = {c: dodge_chance(c, other[c]) for c in other}
+    crit = {c: crit_chance(c, other[c]) for c in other}
+    heal = {c: heal_chance(c, other[c]) for c in other}
+    block = {c: defense_chance(c, other[c]) for c in other}
+    stat_difference = {c: max(0, c.power - other[c].power) for c in other}
+
+    attacker_first = attacker.destreza >= defender.destreza
+    winner = None
+
+    while max_rounds is None or result.rounds < max_rounds:
+        result.rounds += 1
+        verbose = log_rounds is None or result.rounds <= log_rounds
+        current_attacker = attacker if attacker_first else defender
+        current_defender = other[current_attacker]
+
+        # As before, the swinging side's dodge chance decides the dodge
+        if rng.random() < dodge[current_attacker] / 100:
+            if verbose:
+                events.append((result.rounds, side[current_defender], DODGE, 0))
+            attacker_first = not attacker_first
+            continue
+
+        weapon_damage = roll_weapon(current_attacker, rng)
+        damage = int(stat_difference[current_attacker] + weapon_damage + rng.randint(1, 3))
+
+        # Crits are rolled and reported but don't change the damage
+        is_crit = rng.random() < crit[current_attacker] / 100
+
+        defense_amount = int(current_defender.forca + current_defender.defense)
+        if rng.random() < block[current_attacker] / 100:
+            damage = max(0, int(damage - defense_amount))
+            if verbose:
+                events.append((result.rounds, side[current_defender], BLOCK, (damage, defense_amount)))
+
+        if damage > 0:
+            if verbose:
+                events.append((result.rounds, side[current_attacker], CRIT if is_crit else HIT, damage))
+
+            current_defender.hp = min(int(current_defender.hp - damage), current_defender.max_hp)
+
+            if rng.random() < heal[current_defender] / 100:
+                heal_percent = 0.1
+                if current_defender.is_camyra:
+                    dev_diff = current_defender.devocao - current_attacker.devocao
+                    heal_percent += min(0.5, (dev_diff // 10) * 0.01)
+
+                heal_amount = int(current_defender.max_hp * heal_percent)
+                current_defender.hp = int(min(current_defender.max_hp, current_defender.hp + heal_amount))
+                if verbose:
+                    events.append((result.rounds, side[current_defender], HEAL, heal_amount))
+
+        if current_defender.hp <= 0:
+            current_defender.hp = 0
+            winner, loser = current_attacker, current_defender
+            break
+
+        attacker_first = not attacker_first
+
+    if log_rounds is not None and result.rounds > log_rounds:
+        events.append((result.rounds, 0, SKIP, result.rounds - log_rounds))
+
+    if winner is None:
+        result.timed_out = True
+        loser = tiebreak_loser(attacker, defender)
+        winner = other[loser]
+        loser.hp = 0
+        events.append((result.rounds, side[winner], TIMEOUT, result.rounds))
+
+    base_xp = rng.randint(1, 100)
+    result.xp = base_xp + max(0, loser.level - winner.level) * 10
+    result.gold = min(loser.gold, int(loser.gold * 0.05))  # 5% of on-hand gold
+
+    events.append((result.rounds, side[winner], DEFEAT, result.xp))
+    result.attacker_won = winner is attacker
+
+    result.attacker_hp = attacker.hp
+    result.defender_hp = defender.hp
+    result.attacker_rep_change, result.defender_rep_change = reputation_changes(
+        attacker, defender, result.attacker_won)
+    return result
+
+def new_seed():
+    return random.getrandbits(32)
+
+def replay_record(seed, attacker, defender, max_rounds=None, log_rounds=None):
+    """What BattleLog keeps to play a fight again: seed, rules and both snapshots.
+
+    Must be taken before resolve_pvp runs, since it changes the snapshots' HP.
+    """
+    return {'v': 2, 'e': ENGINE_VERSION, 's': seed, 'r': [max_rounds, log_rounds],
+            'a': attacker.snapshot(), 'd': defender.snapshot()}
+
+def replay_pvp(record, attacker_name, defender_name):
+    """Play a stored fight again; returns its FightResult, or None for another engine version"""
+    if record.get('e') != ENGINE_VERSION:
+        return None
+    max_rounds, log_rounds = record['r']
+    attacker = Combatant.from_snapshot(0, attacker_name, record['a'])
+    defender = Combatant.from_snapshot(1, defender_name, record['d'])
+    return resolve_pvp(attacker, defender, rng=random.Random(record['s']),
+                       max_rounds=max_rounds, log_rounds=log_rounds)
+
+def apply_pvp_result(attacker, defender, result, now=None):
+    """Write a FightResult back onto the two Character rows; returns the winner"""
+    winner, loser = (attacker, defender) if result.attacker_won else (defender, attacker)
+
+    attacker.healthpoints = result.attacker_hp
+    defender.healthpoints = result.defender_hp
+
+    loser.healthpoints = 0
+    loser.is_dead = True
+    loser.deaths += 1
+    winner.pvp_kills += 1
+    # Plain foreign keys ride along in each row's UPDATE; the relationships
+    # would add a post_update statement per side
+    winner.last_killed_id = loser.id
+    loser.last_killed_by_id = winner.id
+
+    winner.add_xp(result.xp)
+
+    loser.gold -= result.gold
+    winner.gold += result.gold
+
+    attacker.reputation += result.attacker_rep_change
+    defender.reputation += result.defender_rep_change
+    attacker.last_fight_time = now or datetime.utcnow()
+    return winner
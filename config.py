@@ -31,3 +31,30 @@ class Config:
     MASTODON_CLIENT_ID = os.getenv('MASTODON_CLIENT_ID')
     MASTODON_CLIENT_SECRET = os.getenv('MASTODON_CLIENT_SECRET')
     MASTODON_BASE_URL = 'https://mastodon.social'  # Or let users choose their instance
+    # Per-process 'SimpleCache' by default; with several workers use a shared
+    # backend such as 'cache_backends.SQLiteCache' or 'FileSystemCache'
+    # (both keep their files in CACHE_DIR), or 'RedisCache' with CACHE_REDIS_URL
+    CACHE_TYPE = os.getenv('CACHE_TYPE', 'SimpleCache')
+    CACHE_DIR = os.getenv('CACHE_DIR') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'cache')
+    CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL')
+    CACHE_DEFAULT_TIMEOUT = 300
+    CACHE_THRESHOLD = 5000
+    TRANSLATIONS_CHECK_INTERVAL = 5  # Seconds between locale file mtime checks
+    RANKINGS_CACHE_TTL = 300  # Seconds a rankings snapshot is served before a background rebuild
+    RANKINGS_REFRESH_INTERVAL = 30  # Bursts of ranked-column changes coalesce into one refresh per interval
+    RANKINGS_TOP_N = 10  # Players kept per board in the rankings snapshot
+    SIDEBAR_CACHE_TTL = 30  # Seconds the shared sidebar parts (online count, recent players) are cached
+    UNREAD_RECONCILE_MINUTES = 60  # Recount cached unread counters to fix any drift
+    PRESENCE_WINDOW_SECONDS = 300  # Users active this recently count as online
+    PRESENCE_FLUSH_SECONDS = 30  # Activity timestamps are written back in one batch this often
+    JAIL_RELEASE_CHECK_MINUTES = 1  # Expired sentences are written back as released this often
+    LEADERBOARD_RESYNC_MINUTES = 10  # Full leaderboard reload, catches writes from other workers
+    LEADERBOARD_AROUND_RADIUS = 5  # Players shown above and below you on "around me" boards
+    LEADERBOARD_AROUND_MAX_RADIUS = 50
+    JAIL_SYNC_SECONDS = 5  # How often each worker checks whether another one jailed or released someone
+    PVP_REMATCH_COOLDOWN_SECONDS = 300  # The same two characters can fight again after this long
+    FIGHT_MAX_ROUNDS = 200  # Fights still going after this many rounds go to the side with more HP left
+    FIGHT_LOG_ROUNDS = 50  # Rounds written out in the fight log; later ones are summed up in one line
+    BATTLE_REPLAY_CACHE_TTL = 3600  # Seconds a replayed battle log is kept before it is played again
+    FIGHT_ODDS_SIMULATIONS = 2000  # Simulated fights behind the odds preview on the fight page
+    FIGHT_ODDS_CACHE_TTL = 300  # Seconds an odds preview is reused for the same two builds
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+from cache_helpers import cache
+
+PAIR_KEY = 'pvp:pair:{}:{}'
+
+class PairCooldowns:
+    """Time of the last battle between each pair of characters.
+
+    battle_logs is the source of truth: on a cache miss the pair's last
+    battle inside the cooldown window is looked up through the
+    (participant, timestamp, id) history indexes, so the scan is bounded by
+    the window rather than the history. A battle that is found is kept in
+    the cache under the unordered pair until its cooldown ends; "no recent
+    battle" is never cached, since another worker may record one at any time.
+    """
+
+    def __init__(self, seconds=300):
+        self.seconds = seconds
+
+    def init_app(self, app):
+        self.seconds = app.config.get('PVP_REMATCH_COOLDOWN_SECONDS', self.seconds)
+
+    @staticmethod
+    def key(first_id, second_id):
+        return PAIR_KEY.format(min(first_id, second_id), max(first_id, second_id))
+
+    def _last_battle(self, first_id, second_id, cutoff):
+        from database import db, BattleLog
+        return db.session.query(db.func.max(BattleLog.timestamp)).filter(
+            ((BattleLog.attacker_id == first_id) & (BattleLog.timestamp > cutoff) &
+             (BattleLog.defender_id == second_id)) |
+            ((BattleLog.attacker_id == second_id) & (BattleLog.timestamp > cutoff) &
+             (BattleLog.defender_id == first_id))
+        ).scalar()
+
+    def remaining(self, first_id, second_id, now=None):
+        """Seconds before these two may fight again; 0 when they can"""
+        now = now or datetime.utcnow()
+        key = self.key(first_id, second_id)
+        last_battle = cache.get(key)
+        if last_battle is None:
+            last_battle = self._last_battle(first_id, second_id, now - timedelta(seconds=self.seconds))
+            if last_battle is None:
+                return 0
+            left = self.seconds - (now - last_battle).total_seconds()
+            if left > 0:
+                cache.set(key, last_battle, timeout=int(left) + 1)
+        return max(0, self.seconds - (now - last_battle).total_seconds())
+
+    def record(self, first_id, second_id, when=None):
+        """Start the cooldown for a committed battle"""
+        cache.set(self.key(first_id, second_id), when or datetime.utcnow(), timeout=self.seconds)
+
+pair_cooldowns = PairCooldowns()
@@ -4,8 +4,12 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
 import json
 from sqlalchemy import func, event
+from sqlalchemy.orm import validates
 from datetime import timedelta
-from cache_helpers import invalidate_rankings_cache
+from cache_helpers import request_rankings_refresh, invalidate_sidebar_globals, adjust_unread_counts, adjust_faction_totals
+from factions import faction_registry, faction_key
+from leaderboards import leaderboard_index, player_row, ROW_COLUMNS
+from dice import parse_dice
 
 db = SQLAlchemy()
 
@@ -30,6 +34,20 @@ class Item(db.Model):
 
     def __repr__(self):
         return f'<Item {self.translation_key}>'
+    
+    @validates('stats')
+    def validate_stats(self, key, stats):
+        """Reject malformed damage expressions when the item is saved, not mid-fight"""
+        if stats and 'damage' in stats:
+            parse_dice(stats['damage'])
+        return stats
+    
+    @property
+    def dice(self):
+        """Parsed DiceSpec of a weapon's damage, or None"""
+        if self.stats and 'damage' in self.stats:
+            return parse_dice(self.stats['damage'])
+        return None
 
 class CharacterItem(db.Model):
     __tablename__ = 'character_items'
@@ -69,9 +87,11 @@ class User(db.Model, UserMixin):
         
     def is_online(self):
         """Check if the user is currently online"""
-        if not self.last_activity:
+        from presence import presence
+        last_activity = presence.last_seen(self.id) or self.last_activity
+        if not last_activity:
             return False
-        return (datetime.utcnow() - self.last_activity).total_seconds() < 300  # 5 minutes
+        return (datetime.utcnow() - last_activity).total_seconds() < presence.window
     
     def set_fediverse_data(self, data):
         """Helper method to safely set fediverse_data"""
@@ -104,6 +124,29 @@ def normalize_name(name):
     normalized = normalized.encode('ascii', 'ignore').decode('ascii')
     return normalized
 
+class CombatStats:
+    """Equipment-derived numbers read by combat and the HP cap"""
+    
+    __slots__ = ('health_bonus', 'defense', 'weapon_dice', 'weapon_name')
+    
+    def __init__(self, character_items):
+        self.health_bonus = 0
+        self.defense = 0
+        self.weapon_dice = None  # DiceSpec of the equipped weapon
+        self.weapon_name = "bare hands"
+        
+        for character_item in character_items:
+            if not character_item.equipped:
+                continue
+            item = character_item.item
+            stats = item.stats or {}
+            if item.item_type == 'armor':
+                self.health_bonus += stats.get('health_bonus', 0)
+                self.defense += stats.get('defense', 0)
+            elif item.item_type == 'weapon' and self.weapon_dice is None and 'damage' in stats:
+                self.weapon_dice = item.dice
+                self.weapon_name = item.translation_key.replace('_', ' ').title()
+
 class Character(db.Model):
     __tablename__ = 'characters'
     
@@ -226,20 +269,28 @@ class Character(db.Model):
         print(f"Reputation change: {self.name} {old_rep} -> {self.reputation} ({'+' if amount >=0 else ''}{amount})")
         return self
     
+    @property
+    def combat_stats(self):
+        """Equipment snapshot, built once per loaded instance.
+
+        Dropped when the instance is expired (every commit) and by
+        invalidate_combat_stats() when equipment changes mid-request.
+        """
+        stats = getattr(self, '_combat_stats', None)
+        if stats is None:
+            stats = self._combat_stats = CombatStats(self.items)
+        return stats
+    
+    def invalidate_combat_stats(self):
+        self._combat_stats = None
+    
     @property
     def max_healthpoints(self):
-        from flask import current_app
-        faction_stats = current_app.config['FACTION_STATS'].get(self.faction, {})
-        base_hp = faction_stats.get('stats', {}).get('healthpoints', {}).get('base', 20)
+        base_hp = faction_registry.base_stat(self.faction, 'healthpoints', 20)
         
         level_hp = self.level * 5
         
-        armor_bonus = 0
-        for item in self.items:
-            if item.equipped and item.item.item_type == 'armor' and 'health_bonus' in item.item.stats:
-                armor_bonus += item.item.stats['health_bonus']
-    
-        return base_hp + level_hp + armor_bonus
+        return base_hp + level_hp + self.combat_stats.health_bonus
     
     @property
     def healthpoints(self):
@@ -251,23 +302,190 @@ class Character(db.Model):
         if self._healthpoints <= 0:
             self.is_dead = True  
 
+def drop_combat_stats(target, attrs):
+    """Committed equipment changes reload the items, so rebuild the snapshot too"""
+    if target is not None:
+        target.invalidate_combat_stats()
+
+event.listen(Character, 'expire', drop_combat_stats)
+
+def load_principal(user_id):
+    """Load a user with character, inventory items and current jail in one joined query.
+
+    Used as the Flask-Login user loader so the jail checks, the sidebar and
+    the HP/combat helpers don't lazy-load each relationship (and every
+    inventory row's Item) on each request.
+    """
+    from sqlalchemy.orm import joinedload
+    character = joinedload(User.character)
+    return db.session.get(User, user_id, options=[
+        character.joinedload(Character.current_jail),
+        character.joinedload(Character.items).joinedload(CharacterItem.item)
+    ])
+
 def setup_ranking_invalidation():
     """Setup SQLAlchemy event listeners"""
     from sqlalchemy import event
+    from sqlalchemy import inspect
+    from sqlalchemy.orm import Session, object_session
+    
+    def ranked_columns_changed(target):
+        state = inspect(target)
+        return any(state.attrs[column].history.has_changes() for column in ROW_COLUMNS)
+    
+    def pending_changes(target):
+        session = object_session(target)
+        if session is None:
+            return None
+        return session.info.setdefault('leaderboard_pending', {})
     
     def auto_invalidate_rankings(mapper, connection, target):
         """SQLAlchemy event listener"""
         if isinstance(target, Character):
-            invalidate_rankings_cache()
+            pending = pending_changes(target)
+            if pending is not None:
+                pending[target.id] = player_row(target)
+    
+    def auto_update_rankings(mapper, connection, target):
+        """Only stage updates that touched a ranked column"""
+        if isinstance(target, Character) and ranked_columns_changed(target):
+            auto_invalidate_rankings(mapper, connection, target)
+    
+    def auto_remove_from_rankings(mapper, connection, target):
+        if isinstance(target, Character):
+            pending = pending_changes(target)
+            if pending is not None:
+                pending[target.id] = None
+    
+    def apply_ranking_changes(session):
+        """Move committed characters in the leaderboard index, O(log n) each"""
+        pending = session.info.pop('leaderboard_pending', None)
+        if not pending:
+            return
+        for character_id, row in pending.items():
+            if row is None:
+                leaderboard_index.discard(character_id)
+            else:
+                leaderboard_index.apply(row)
+        request_rankings_refresh()
+    
+    def discard_ranking_changes(session):
+        session.info.pop('leaderboard_pending', None)
     
     event.listen(Character, 'after_insert', auto_invalidate_rankings)
-    event.listen(Character, 'after_update', auto_invalidate_rankings)
-    event.listen(Character, 'after_delete', auto_invalidate_rankings)
+    event.listen(Character, 'after_update', auto_update_rankings)
+    event.listen(Character, 'after_delete', auto_remove_from_rankings)
+    event.listen(Session, 'after_commit', apply_ranking_changes)
+    event.listen(Session, 'after_rollback', discard_ranking_changes)
 
 setup_ranking_invalidation()          
 
+def setup_presence_cleanup():
+    """Take users off the online list once their character or account deletion commits"""
+    from sqlalchemy.orm import Session, object_session
+    
+    def stage_offline(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            user_id = target.id if isinstance(target, User) else target.user_id
+            session.info.setdefault('presence_offline', set()).add(user_id)
+    
+    def apply_offline(session):
+        from presence import presence
+        for user_id in session.info.pop('presence_offline', ()):
+            presence.discard(user_id)
+    
+    def discard_offline(session):
+        session.info.pop('presence_offline', None)
+    
+    event.listen(User, 'after_delete', stage_offline)
+    event.listen(Character, 'after_delete', stage_offline)
+    event.listen(Session, 'after_commit', apply_offline)
+    event.listen(Session, 'after_rollback', discard_offline)
+
+setup_presence_cleanup()
+
+FACTION_TOTAL_COLUMNS = {'pvp_kills': 'kills', 'deaths': 'deaths'}
+
+def setup_faction_totals():
+    """Keep the shared per-faction kill, death and member counters in step with committed writes"""
+    from sqlalchemy import inspect
+    from sqlalchemy.orm import Session, object_session
+    from sqlalchemy.orm.base import NO_VALUE
+    
+    def old_value(state, column):
+        """Committed value of a column, or NO_VALUE when it was never loaded"""
+        attr = state.attrs[column]
+        history = attr.history
+        if history.has_changes():
+            return history.deleted[0] if history.deleted else NO_VALUE
+        return attr.loaded_value
+    
+    def stage(target, old, new):
+        """Queue moving a character's contribution from ``old`` to ``new`` (dicts of column values)"""
+        session = object_session(target)
+        if session is None:
+            return
+        deltas = session.info.setdefault('faction_deltas', {})
+        stale = session.info.setdefault('faction_stale', set())
+        for values, sign in ((old, -1), (new, 1)):
+            if values is None:
+                continue
+            if NO_VALUE in values.values():
+                # Without the committed value the delta is unknown; recount instead
+                if values['faction'] is NO_VALUE:
+                    stale.update(faction.key for faction in faction_registry)
+                else:
+                    stale.add(faction_key(values['faction']))
+                continue
+            faction = faction_key(values['faction'])
+            deltas[faction, 'count'] = deltas.get((faction, 'count'), 0) + sign
+            for column, field in FACTION_TOTAL_COLUMNS.items():
+                deltas[faction, field] = deltas.get((faction, field), 0) + sign * (values[column] or 0)
+    
+    def current(target):
+        return {column: getattr(target, column) for column in ('faction', *FACTION_TOTAL_COLUMNS)}
+    
+    def character_inserted(mapper, connection, target):
+        stage(target, None, current(target))
+    
+    def character_updated(mapper, connection, target):
+        state = inspect(target)
+        columns = ('faction', *FACTION_TOTAL_COLUMNS)
+        if not any(state.attrs[column].history.has_changes() for column in columns):
+            return
+        stage(target, {column: old_value(state, column) for column in columns}, current(target))
+    
+    def character_deleted(mapper, connection, target):
+        state = inspect(target)
+        stage(target, {column: state.attrs[column].loaded_value
+                       for column in ('faction', *FACTION_TOTAL_COLUMNS)}, None)
+    
+    def apply_faction_totals(session):
+        deltas = session.info.pop('faction_deltas', None)
+        stale = session.info.pop('faction_stale', None)
+        if deltas or stale:
+            adjust_faction_totals(deltas or {}, stale or ())
+    
+    def discard_faction_totals(session):
+        session.info.pop('faction_deltas', None)
+        session.info.pop('faction_stale', None)
+    
+    event.listen(Character, 'after_insert', character_inserted)
+    event.listen(Character, 'after_update', character_updated)
+    event.listen(Character, 'after_delete', character_deleted)
+    event.listen(Session, 'after_commit', apply_faction_totals)
+    event.listen(Session, 'after_rollback', discard_faction_totals)
+
+setup_faction_totals()
+
 class BattleLog(db.Model):
     __tablename__ = 'battle_logs'
+    # Battle history is paged by (timestamp, id) separately for each side of the fight
+    __table_args__ = (
+        db.Index('ix_battle_logs_attacker_history', 'attacker_id', 'timestamp', 'id'),
+        db.Index('ix_battle_logs_defender_history', 'defender_id', 'timestamp', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     attacker_id = db.Column(db.Integer, db.ForeignKey('characters.id'))
@@ -295,6 +513,23 @@ class BattleLog(db.Model):
     defender = db.relationship('Character', foreign_keys=[defender_id])
     winner = db.relationship('Character', foreign_keys=[winner_id])
 
+def add_missing_columns():
+    """create_all never alters existing tables; add the nullable columns they are missing"""
+    inspector = db.inspect(db.engine)
+    for table in (Message.__table__, Jail.__table__):
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.execute(db.text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}'))
+
+def create_missing_indexes():
+    """create_all only adds indexes together with their table; add new ones to existing tables"""
+    for index in BattleLog.__table__.indexes | Jail.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
 class MiningLottery(db.Model):
     __tablename__ = 'mining_lottery'
     
@@ -335,6 +570,7 @@ class Message(db.Model):
     is_read = db.Column(db.Boolean, default=False)
     is_admin_message = db.Column(db.Boolean, default=False)
     parent_message_id = db.Column(db.Integer, db.ForeignKey('messages.id'))
+    battle_id = db.Column(db.Integer, db.ForeignKey('battle_logs.id', ondelete='SET NULL'), nullable=True)  # Set only on battle notices
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     expires_at = db.Column(db.DateTime, default=lambda: datetime.utcnow() + timedelta(days=30))
     
@@ -345,7 +581,95 @@ class Message(db.Model):
     def mark_as_read(self):
         self.is_read = True
         db.session.commit()
+    
+    @property
+    def display_body(self):
+        """Body as shown to players, with battle notices worded in their language"""
+        if self.battle_id is None:
+            return self.body
+        from flask import g, url_for
+        from battle_events import render_notice
+        return render_notice(self.sender_id == self.recipient_id,
+                             url_for('game.battle_log', battle_id=self.battle_id),
+                             getattr(g, 'translations', None))
+
+def stage_unread_delta(session, recipient_id, delta):
+    """Queue an unread-counter change, applied when the session commits"""
+    if session is not None and recipient_id is not None:
+        deltas = session.info.setdefault('sidebar_unread', {})
+        deltas[recipient_id] = deltas.get(recipient_id, 0) + delta
+
+def send_battle_notices(battle, attacker, defender):
+    """Notify both fighters with a single INSERT.
+
+    The notices point at the BattleLog through battle_id and are worded when
+    shown; the body is only a plain fallback for when the battle is deleted.
+    """
+    now = datetime.utcnow()
+    expires_at = now + timedelta(days=30)
+    db.session.execute(db.insert(Message), [
+        {'sender_id': battle.winner_id, 'recipient_id': recipient.id, 'battle_id': battle.id,
+         'subject': f"Battle Result vs {opponent.name}",
+         'body': f"You {'won' if recipient.id == battle.winner_id else 'lost'} the battle against {opponent.name}.",
+         'is_read': False, 'is_admin_message': False, 'created_at': now, 'expires_at': expires_at}
+        for recipient, opponent in ((attacker, defender), (defender, attacker))
+    ])
+    # Bulk inserts skip the mapper events, so count the unread notices here
+    stage_unread_delta(db.session(), attacker.id, 1)
+    stage_unread_delta(db.session(), defender.id, 1)
         
+def setup_sidebar_invalidation():
+    """Keep cached sidebar data in step with committed writes"""
+    from sqlalchemy import inspect
+    from sqlalchemy.orm import Session, object_session
+    
+    def stage_message_delta(target, delta):
+        stage_unread_delta(object_session(target), target.recipient_id, delta)
+    
+    def message_inserted(mapper, connection, target):
+        if not target.is_read:
+            stage_message_delta(target, 1)
+    
+    def message_updated(mapper, connection, target):
+        history = inspect(target).attrs.is_read.history
+        if not history.has_changes():
+            return
+        was_read = bool(history.deleted[0]) if history.deleted else False
+        if was_read != bool(target.is_read):
+            stage_message_delta(target, 1 if was_read else -1)
+    
+    def message_deleted(mapper, connection, target):
+        # Expired messages already dropped out of the count at reconciliation
+        expired = target.expires_at is not None and target.expires_at <= datetime.utcnow()
+        if not target.is_read and not expired:
+            stage_message_delta(target, -1)
+    
+    def stage_roster_change(mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info['sidebar_roster'] = True
+    
+    def apply_sidebar_changes(session):
+        deltas = session.info.pop('sidebar_unread', None)
+        if deltas:
+            adjust_unread_counts(deltas)
+        if session.info.pop('sidebar_roster', False):
+            invalidate_sidebar_globals()
+    
+    def discard_sidebar_changes(session):
+        session.info.pop('sidebar_unread', None)
+        session.info.pop('sidebar_roster', None)
+    
+    event.listen(Message, 'after_insert', message_inserted)
+    event.listen(Message, 'after_update', message_updated)
+    event.listen(Message, 'after_delete', message_deleted)
+    event.listen(Character, 'after_insert', stage_roster_change)
+    event.listen(Character, 'after_delete', stage_roster_change)
+    event.listen(Session, 'after_commit', apply_sidebar_changes)
+    event.listen(Session, 'after_rollback', discard_sidebar_changes)
+
+setup_sidebar_invalidation()
+
 class MessageReport(db.Model):
     __tablename__ = 'message_reports'
     
@@ -368,6 +692,7 @@ class Jail(db.Model):
     start_time = db.Column(db.DateTime, default=datetime.utcnow)
     duration = db.Column(db.Integer)
     duration_unit = db.Column(db.String(10))
+    jail_until = db.Column(db.DateTime, nullable=True, index=True)  # start_time + duration; unset on rows from before it existed
     real_reason = db.Column(db.Text, nullable=False)
     game_reason = db.Column(db.Text, nullable=False)
     is_released = db.Column(db.Boolean, default=False)
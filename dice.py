@@ -0,0 +1,43 @@
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+MAX_DICE = 100
+MAX_SIDES = 1000
+
+_EXPRESSION = re.compile(r'^\s*(\d+)\s*[dD]\s*(\d+)\s*$')
+
+class DiceSpec(namedtuple('DiceSpec', ('count', 'sides'))):
+    """Parsed ``NdM`` damage expression; unpacks as (count, sides)"""
+
+    __slots__ = ()
+
+    def roll(self, rng):
+        """One roll with a ``random``-style generator, one randint per die"""
+        if self.count == 1:
+            return rng.randint(1, self.sides)
+        return sum(rng.randint(1, self.sides) for _ in range(self.count))
+
+    def roll_many(self, generator, size):
+        """``size`` rolls in one draw from a numpy Generator"""
+        return generator.integers(1, self.sides + 1, size=(size, self.count)).sum(axis=1)
+
+    @property
+    def average(self):
+        return self.count * (self.sides + 1) / 2
+
+    def __str__(self):
+        return f"{self.count}d{self.sides}"
+
+@lru_cache(maxsize=None)
+def parse_dice(expression):
+    """Parse ``NdM`` into a DiceSpec; raises ValueError for anything else"""
+    match = _EXPRESSION.match(str(expression))
+    if not match:
+        raise ValueError(f"Invalid damage expression {expression!r}, expected e.g. 2d6")
+    count, sides = int(match.group(1)), int(match.group(2))
+    if not 1 <= count <= MAX_DICE:
+        raise ValueError(f"Damage dice count must be between 1 and {MAX_DICE}")
+    if not 1 <= sides <= MAX_SIDES:
+        raise ValueError(f"Damage dice sides must be between 1 and {MAX_SIDES}")
+    return DiceSpec(count, sides)
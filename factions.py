@@ -0,0 +1,121 @@
+import os
+import json
+import logging
+
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), 'config', 'factions.json')
+
+DEFAULT_COLOR = '#cccccc'
+DEFAULT_RESOURCE_NAME = 'Resource'
+DEFAULT_RESOURCE_IMAGE = 'resource.webp'
+
+logger = logging.getLogger(__name__)
+
+def faction_key(faction):
+    """Case-insensitive key used for every faction lookup"""
+    return faction.lower() if faction else ''
+
+class Faction:
+    """Precomputed view of one faction from config/factions.json"""
+
+    __slots__ = ('key', 'name', 'stats', 'base_stats', 'per_level', 'main_stat',
+                 'resource_name', 'resource_image', 'color', 'enemy', 'image')
+
+    def __init__(self, name, data):
+        stats = data.get('stats', {})
+        self.key = faction_key(name)
+        self.name = name
+        self.stats = stats
+        self.base_stats = {stat: values.get('base') for stat, values in stats.items()
+                           if isinstance(values, dict) and 'base' in values}
+        self.per_level = {stat: values.get('per_level') for stat, values in stats.items()
+                          if isinstance(values, dict) and 'per_level' in values}
+        self.main_stat = data.get('main_stat')
+        self.resource_name = stats.get('resource_name', DEFAULT_RESOURCE_NAME)
+        self.resource_image = stats.get('resource_image', DEFAULT_RESOURCE_IMAGE)
+        self.color = data.get('color', DEFAULT_COLOR)
+        self.enemy = faction_key(data.get('enemy'))
+        self.image = f"{self.key}.webp"
+
+class FactionRegistry:
+    """In-memory faction registry, read from disk once per process"""
+
+    def __init__(self, config_path=CONFIG_PATH):
+        self.config_path = config_path
+        self.raw = {}
+        self._factions = None
+
+    def init_app(self, app):
+        self.config_path = os.path.join(app.root_path, 'config', 'factions.json')
+        self.load(app.logger)
+        app.config['FACTION_STATS'] = self.raw
+
+    def load(self, log=None):
+        try:
+            with open(self.config_path, 'r', encoding='utf-8') as f:
+                self.raw = json.load(f)['factions']
+        except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
+            (log or logger).error(f"Failed to load faction stats: {str(e)}")
+            self.raw = {}
+        self._factions = {faction_key(name): Faction(name, data) for name, data in self.raw.items()}
+
+    def _all(self):
+        if self._factions is None:
+            self.load()
+        return self._factions
+
+    def get(self, faction):
+        return self._all().get(faction_key(faction))
+
+    def __iter__(self):
+        return iter(self._all().values())
+
+    def stats(self, faction):
+        found = self.get(faction)
+        return found.stats if found else {}
+
+    def base_stat(self, faction, stat, default=None):
+        found = self.get(faction)
+        return found.base_stats.get(stat, default) if found else default
+
+    def per_level(self, faction, stat, default=None):
+        found = self.get(faction)
+        return found.per_level.get(stat, default) if found else default
+
+    def main_stat(self, faction):
+        found = self.get(faction)
+        return found.main_stat if found else None
+
+    def resource_name(self, faction):
+        found = self.get(faction)
+        return found.resource_name if found else DEFAULT_RESOURCE_NAME
+
+    def resource_image(self, faction):
+        found = self.get(faction)
+        return found.resource_image if found else DEFAULT_RESOURCE_IMAGE
+
+    def resource_info(self, faction):
+        return {
+            'name': self.resource_name(faction),
+            'image': self.resource_image(faction)
+        }
+
+    def color(self, faction):
+        found = self.get(faction)
+        return found.color if found else DEFAULT_COLOR
+
+    def image(self, faction):
+        return f"{faction_key(faction)}.webp"
+
+    def enemy(self, faction):
+        """Lowercase key of the faction's sworn enemy, or None"""
+        found = self.get(faction)
+        return (found.enemy or None) if found else None
+
+    def is_enemy(self, faction, other):
+        return self.enemy(faction) == faction_key(other)
+
+    def matches(self, faction, key):
+        """True when ``faction`` is the faction named by ``key``, ignoring case"""
+        return faction_key(faction) == faction_key(key)
+
+faction_registry = FactionRegistry()
@@ -1,106 +1,96 @@
 from flask import Blueprint, render_template, request, flash, redirect, url_for, current_app, jsonify
 from flask_login import login_required, current_user
-from database import db, Character, normalize_name, BattleLog, Item, User, CharacterItem, MiningLottery, LotteryEntry, LotteryWinner, Message, MessageReport, Jail, NPC, Quest, QuestObjective, QuestReward, PlayerQuest, QuestProgress # Updated imports
+from database import db, Character, normalize_name, send_battle_notices, stage_unread_delta, BattleLog, Item, User, CharacterItem, MiningLottery, LotteryEntry, LotteryWinner, Message, MessageReport, Jail, NPC, Quest, QuestObjective, QuestReward, PlayerQuest, QuestProgress # Updated imports
 from flask import g
 from auth import load_translations, get_current_language
+from translations import catalog
+from factions import faction_registry
 import json
 import os
 import random
 from datetime import datetime, timedelta
-from cache_helpers import get_cached_rankings
+from cache_helpers import get_cached_rankings, get_sidebar_snapshot
+from leaderboards import leaderboard_index, BOARDS
+from presence import presence
+from jails import jail_gate, release_time
+from cooldowns import pair_cooldowns
+from combat import Combatant, resolve_pvp, apply_pvp_result, player_power, new_seed, replay_record
+from simulation import get_cached_odds
+from battle_events import render_events, render_stored_log
+from battle_history import battle_page
 from functools import wraps
 from markupsafe import Markup
 from sqlalchemy import or_ 
 
 game_bp = Blueprint('game', __name__)
 
+# Pages a jailed player may still open
+JAIL_ALLOWED_ENDPOINTS = ('game.jail', 'game.mailbox', 'game.view_message', 'game.send_message')
+
+def current_user_jailed():
+    """Jail status of the current player, decided once per request from the jail gate"""
+    if 'is_jailed' not in g:
+        character = getattr(current_user, 'character', None)
+        g.is_jailed = character is not None and jail_gate.is_jailed(character.id)
+    return g.is_jailed
+
+def jail_redirect(allowed_endpoints=()):
+    """Where to send the current user instead, or None if they may proceed"""
+    if not current_user.is_authenticated or request.endpoint == 'game.create_character':
+        return None
+    
+    if getattr(current_user, 'character', None) is None:
+        return redirect(url_for('game.create_character'))
+    
+    if current_user_jailed() and request.endpoint not in allowed_endpoints:
+        return redirect(url_for('game.jail'))
+    return None
+
 def not_jailed(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if current_user.is_authenticated:
-            if request.endpoint == 'game.create_character':
-                return f(*args, **kwargs)
-            
-            if not hasattr(current_user, 'character') or current_user.character is None:
-                return redirect(url_for('game.create_character'))
-            
-            if current_user.character.is_jailed:
-                jail_record = current_user.character.current_jail
-                if datetime.utcnow() > jail_record.start_time + timedelta(minutes=jail_record.duration):
-                    current_user.character.is_jailed = False
-                    jail_record.is_released = True
-                    db.session.commit()
-                else:
-                    flash("You are currently jailed and cannot perform this action", 'error')
-                    return redirect(url_for('game.jail'))
+        response = jail_redirect()
+        if response is not None:
+            if current_user_jailed():
+                flash("You are currently jailed and cannot perform this action", 'error')
+            return response
         return f(*args, **kwargs)
     return decorated_function
 
-def load_faction_stats():
-    config_path = os.path.join(current_app.root_path, 'config', 'factions.json')
-    try:
-        with open(config_path, 'r', encoding='utf-8') as f:
-            return json.load(f)['factions']
-    except (FileNotFoundError, json.JSONDecodeError, KeyError) as e:
-        current_app.logger.error(f"Failed to load faction stats: {str(e)}")
-        return {}
-
 def get_faction_resource_name(faction_key):
-    faction_stats = load_faction_stats()
-    return faction_stats.get(faction_key, {}).get('stats', {}).get('resource_name', 'Resource')
+    return faction_registry.resource_name(faction_key)
 
 def get_faction_resource_image(faction_key):
-    faction_stats = load_faction_stats()
-    return faction_stats.get(faction_key, {}).get('stats', {}).get('resource_image', 'resource.webp')
+    return faction_registry.resource_image(faction_key)
 
-# Add this new function to game.py
 def get_faction_resource_info(faction_key):
-    return {
-        'name': get_faction_resource_name(faction_key),
-        'image': get_faction_resource_image(faction_key)
-    }
+    return faction_registry.resource_info(faction_key)
 
 @game_bp.before_request
 def update_last_activity():
     if current_user.is_authenticated:
-        current_user.last_activity = datetime.utcnow()
-        db.session.commit()
+        presence.touch(current_user.id, has_character=current_user.character is not None)
 
 
 def calculate_player_variable(character):
-    if character.faction.lower() == 'veylan':
-        main_stat = character.destreza
-    elif character.faction.lower() == 'urghan':
-        main_stat = character.forca
-    elif character.faction.lower() == 'aureen':
-        main_stat = character.inteligencia
-    elif character.faction.lower() == 'camyra':
-        main_stat = character.devocao
-    else:
-        main_stat = 0  # fallback
-    
-    other_stats = (character.forca + character.destreza + 
-                  character.inteligencia + character.devocao - main_stat)
-    
-    return (0.75 * main_stat) + (0.35 * other_stats)
+    return player_power(character.faction, character.forca, character.destreza,
+                        character.inteligencia, character.devocao)
 
 def calculate_weapon_damage(character):
     weapon_damage = 0
     weapon_name = "bare hands"
     
     if isinstance(character, NPC):
-        if character.weapon and 'damage' in character.weapon.stats:
-            dice_count, dice_type = map(int, character.weapon.stats['damage'].split('d'))
-            weapon_damage = sum(random.randint(1, dice_type) for _ in range(dice_count))
+        dice = character.weapon.dice if character.weapon else None
+        if dice:
+            weapon_damage = dice.roll(random)
             weapon_name = character.weapon.translation_key.replace('_', ' ').title()
         return weapon_damage, weapon_name
     
-    for item in character.items:
-        if item.equipped and item.item.item_type == 'weapon' and 'damage' in item.item.stats:
-            dice_count, dice_type = map(int, item.item.stats['damage'].split('d'))
-            weapon_damage = sum(random.randint(1, dice_type) for _ in range(dice_count))
-            weapon_name = item.item.translation_key.replace('_', ' ').title()
-            break
+    stats = character.combat_stats
+    if stats.weapon_dice:
+        weapon_damage = stats.weapon_dice.roll(random)
+        weapon_name = stats.weapon_name
     
     return weapon_damage, weapon_name
 
@@ -139,8 +129,6 @@ def create_character():
         flash(g.translations['game']['character_creation']['already_exists'])
         return redirect(url_for('game.dashboard'))
     
-    faction_stats = load_faction_stats()
-    
     if request.method == 'POST':
         name = request.form.get('character_name').strip()
         faction = request.form.get('faction')
@@ -155,8 +143,6 @@ def create_character():
             return redirect(url_for('game.create_character'))
             
         try:
-            stats = faction_stats.get(faction, {}).get('stats', {})
-            
             character = Character(
                 user_id=current_user.id,
                 name=name,
@@ -165,15 +151,15 @@ def create_character():
                 level=1,
                 current_xp=0,
                 xp_to_next_level=150,
-                destreza=stats.get('destreza', {}).get('base', 10),
-                forca=stats.get('forca', {}).get('base', 10),
-                inteligencia=stats.get('inteligencia', {}).get('base', 10),
-                devocao=stats.get('devocao', {}).get('base', 10),
-                destreza_per_level=stats.get('destreza', {}).get('per_level', 1.0),
-                forca_per_level=stats.get('forca', {}).get('per_level', 1.0),
-                inteligencia_per_level=stats.get('inteligencia', {}).get('per_level', 1.0),
-                devocao_per_level=stats.get('devocao', {}).get('per_level', 1.0),
-                healthpoints_per_level=stats.get('healthpoints', {}).get('per_level', 10)
+                destreza=faction_registry.base_stat(faction, 'destreza', 10),
+                forca=faction_registry.base_stat(faction, 'forca', 10),
+                inteligencia=faction_registry.base_stat(faction, 'inteligencia', 10),
+                devocao=faction_registry.base_stat(faction, 'devocao', 10),
+                destreza_per_level=faction_registry.per_level(faction, 'destreza', 1.0),
+                forca_per_level=faction_registry.per_level(faction, 'forca', 1.0),
+                inteligencia_per_level=faction_registry.per_level(faction, 'inteligencia', 1.0),
+                devocao_per_level=faction_registry.per_level(faction, 'devocao', 1.0),
+                healthpoints_per_level=faction_registry.per_level(faction, 'healthpoints', 10)
             )
             
             db.session.add(character)
@@ -213,7 +199,7 @@ def create_character():
                 'motto': faction_data.get('motto', ''),
                 'belief': faction_data.get('belief', ''),
                 'valor': faction_data.get('valor', ''),
-                'stat_values': faction_stats.get(faction_key, {}).get('stats', {}),
+                'stat_values': faction_registry.stats(faction_key),
                 'skill_name': faction_data.get('skill_name', '')
             }
             factions.append(faction_info)
@@ -437,15 +423,7 @@ def utility_processor():
             current_app.logger.error(f"Error getting reward text: {str(e)}")
             return f"{reward.reward_type}: {reward.amount}"
 
-    def get_faction_resource_info(faction_key):
-        faction_stats = load_faction_stats()
-        faction_data = faction_stats.get(faction_key, {})
-        return {
-            'name': faction_data.get('stats', {}).get('resource_name', 'Resource'),
-            'image': faction_data.get('stats', {}).get('resource_image', 'resource.webp')
-        }
-            
-    return dict(get_objective_text=get_objective_text, get_reward_text=get_reward_text, get_faction_resource_info=get_faction_resource_info)
+    return dict(get_objective_text=get_objective_text, get_reward_text=get_reward_text, get_faction_resource_info=faction_registry.resource_info)
 
 
 def assign_daily_quests(character):
@@ -754,21 +732,12 @@ def view_character(character_id):
     
     faction_data = g.translations['game']['factions'].get(character.faction, {})
     
-    page = request.args.get('page', 1, type=int)
-    per_page = 10
-    
-    battle_logs = BattleLog.query.filter(
-        (BattleLog.attacker_id == character.id) |
-        (BattleLog.defender_id == character.id)
-    ).order_by(BattleLog.timestamp.desc()).paginate(page=page, per_page=per_page)
-    
-    rankings = get_cached_rankings()
-    user_ranks = {
-        'xp': next((i+1 for i,c in enumerate(rankings['xp']) if c['id'] == character.id), None),
-        'level': next((i+1 for i,c in enumerate(rankings['level']) if c['id'] == character.id), None),
-        'kills': next((i+1 for i,c in enumerate(rankings['kills']) if c['id'] == character.id), None),
-        'deaths': next((i+1 for i,c in enumerate(rankings['deaths']) if c['id'] == character.id), None)
-    }
+    battle_logs = battle_page(character.id,
+                              before=request.args.get('before'),
+                              after=request.args.get('after'),
+                              per_page=10)
+    
+    user_ranks = leaderboard_index.ranks_of(character.id)
     
     return render_template('view_character.html',
                          viewed_character=character,
@@ -855,11 +824,7 @@ def dashboard():
     max_possible_heal = max_hp - current_hp
     default_heal = min(10, max_possible_heal) if max_possible_heal > 0 else 0
     
-    json_path = os.path.join(current_app.root_path, 'locales', current_lang, 'game', 'buildings.json')
-    with open(json_path, encoding='utf-8') as f:
-        buildings_data = json.load(f)
-    
-    buildings = buildings_data.get("buildings", [])
+    buildings = [dict(b) for b in g.translations['game']['buildings']]
     
     def get_url_by_key(key):
         return {
@@ -901,52 +866,29 @@ def inject_sidebar_data():
     if not current_user.is_authenticated:
         return {}
     
-    online_count = User.query.filter(
-        User.last_activity > datetime.utcnow() - timedelta(minutes=5),
-        User.character != None
-    ).count()
-    
-    recent_players = Character.query \
-        .order_by(Character.created_at.desc()) \
-        .limit(3) \
-        .all()
-        
-    unread_count = 0
-    if hasattr(current_user, 'character') and current_user.character:
-        unread_count = Message.query.filter(
-            Message.recipient_id == current_user.character.id,
-            Message.is_read == False,
-            Message.expires_at > datetime.utcnow()
-        ).count()
+    character = getattr(current_user, 'character', None)
+    sidebar = get_sidebar_snapshot(character.id if character else None)
     
-    if not hasattr(current_user, 'character') or current_user.character is None:
+    if character is None:
         return {
             'user_xp_rank': None,
             'user_level_rank': None,
             'user_kills_rank': None,
             'user_deaths_rank': None,
-            'recent_players': recent_players,
+            'recent_players': sidebar['recent_players'],
             'unread_message_count': 0
         }
     
-    rankings = get_cached_rankings()
-    char_id = current_user.character.id
-    
-    user_ranks = {
-        'xp': next((i+1 for i,c in enumerate(rankings['xp']) if c['id'] == char_id), None),
-        'level': next((i+1 for i,c in enumerate(rankings['level']) if c['id'] == char_id), None),
-        'kills': next((i+1 for i,c in enumerate(rankings['kills']) if c['id'] == char_id), None),
-        'deaths': next((i+1 for i,c in enumerate(rankings['deaths']) if c['id'] == char_id), None)
-    }
+    user_ranks = leaderboard_index.ranks_of(current_user.character.id)
     
     return {
         'user_xp_rank': user_ranks['xp'],
         'user_level_rank': user_ranks['level'],
         'user_kills_rank': user_ranks['kills'],
         'user_deaths_rank': user_ranks['deaths'],
-        'recent_players': recent_players,
-        'online_count': online_count,
-        'unread_message_count': unread_count,
+        'recent_players': sidebar['recent_players'],
+        'online_count': sidebar['online_count'],
+        'unread_message_count': sidebar['unread_message_count'],
         'character_data': {  
             'max_hp': current_user.character.max_healthpoints,
             'current_hp': current_user.character.healthpoints,
@@ -983,26 +925,20 @@ def fight(opponent_id):
         flash(f"{opponent.name} is already defeated!", 'error')
         return redirect(url_for('game.view_character', character_id=opponent_id))
     
-    existing_battle = BattleLog.query.filter(
-        ((BattleLog.attacker_id == current_user.character.id) & 
-         (BattleLog.defender_id == opponent.id)) | 
-        ((BattleLog.attacker_id == opponent.id) & 
-         (BattleLog.defender_id == current_user.character.id))
-    ).order_by(BattleLog.timestamp.desc()).first()
-    
-    if existing_battle:
-        if existing_battle.winner_id:
-            time_since_battle = (datetime.utcnow() - existing_battle.timestamp).total_seconds()
-            if time_since_battle < 300:
-                flash(f"You recently battled {opponent.name}. Please wait before fighting again.", 'error')
-                return redirect(url_for('game.view_character', character_id=opponent_id))
-        else:
-            flash("You already have an ongoing battle with this opponent!", 'error')
-            return redirect(url_for('game.view_character', character_id=opponent_id))
+    if pair_cooldowns.remaining(current_user.character.id, opponent.id):
+        flash(f"You recently battled {opponent.name}. Please wait before fighting again.", 'error')
+        return redirect(url_for('game.view_character', character_id=opponent_id))
+    
+    odds = get_cached_odds(Combatant.from_character(attacker),
+                           Combatant.from_character(opponent),
+                           n=current_app.config.get('FIGHT_ODDS_SIMULATIONS', 2000),
+                           timeout=current_app.config.get('FIGHT_ODDS_CACHE_TTL', 300),
+                           max_rounds=current_app.config.get('FIGHT_MAX_ROUNDS', 200))
     
     return render_template('fight.html',
                          translations=g.translations,
                          opponent=opponent,
+                         odds=odds,
                          current_user=current_user)
 
 @game_bp.route('/heal', methods=['POST'])
@@ -1068,45 +1004,22 @@ def heal():
 def rankings():
     current_lang = get_current_language()
     translations = load_translations(current_lang)
-
-    translations.setdefault('dashboard', {})
-    translations.setdefault('rankings', {})
-    translations.setdefault('game', {}).setdefault('factions', {})
     
     data = get_cached_rankings()
     
-    top_forca = Character.query.order_by(Character.forca.desc()).limit(10).all()
-    top_destreza = Character.query.order_by(Character.destreza.desc()).limit(10).all()
-    top_inteligencia = Character.query.order_by(Character.inteligencia.desc()).limit(10).all()
-    top_devocao = Character.query.order_by(Character.devocao.desc()).limit(10).all()
-    
-    combined_query = db.session.query(
-        Character,
-        (Character.forca + Character.destreza + Character.inteligencia + Character.devocao).label('combined')
-    ).order_by(db.desc('combined')).limit(10).all()
-    top_combined = [char for char, _ in combined_query]
-    
-    top_reputation = Character.query.order_by(Character.reputation.desc()).limit(10).all()
-    worst_reputation = Character.query.order_by(Character.reputation.asc()).limit(10).all()
-    
-    for char in (top_forca + top_destreza + top_inteligencia + top_devocao + 
-                top_combined + top_reputation + worst_reputation):
-        if not hasattr(char, 'faction_image'):
-            char.faction_image = f"{char.faction.lower()}.webp"
-    
     return render_template('rankings.html',
         translations=translations,
         top_xp=data['xp'][:10],
         top_level=data['level'][:10],
         top_kills=data['kills'][:10],
         top_deaths=data['deaths'][:10],
-        top_forca=top_forca,
-        top_destreza=top_destreza,
-        top_inteligencia=top_inteligencia,
-        top_devocao=top_devocao,
-        top_combined=top_combined,
-        top_reputation=top_reputation,
-        worst_reputation=worst_reputation,
+        top_forca=data['forca'][:10],
+        top_destreza=data['destreza'][:10],
+        top_inteligencia=data['inteligencia'][:10],
+        top_devocao=data['devocao'][:10],
+        top_combined=data['combined'][:10],
+        top_reputation=data['reputation'][:10],
+        worst_reputation=data['worst_reputation'][:10],
         faction_kills=data['faction_kills'],
         faction_deaths=data['faction_deaths'],
         faction_count=data['faction_count'],
@@ -1118,6 +1031,50 @@ def rankings():
         mining_level=data['mining_level'],
         diamonds=data['diamonds']
     )
+
+def leaderboard_radius():
+    """Requested ``radius`` query arg, clamped to the configured maximum"""
+    default = current_app.config.get('LEADERBOARD_AROUND_RADIUS', 5)
+    limit = current_app.config.get('LEADERBOARD_AROUND_MAX_RADIUS', 50)
+    radius = request.args.get('radius', default, type=int)
+    return max(0, min(radius, limit))
+
+@game_bp.route('/rankings/<board>/around/<int:character_id>')
+@login_required
+@not_jailed
+def rankings_around(board, character_id):
+    if board not in BOARDS:
+        return jsonify({'error': 'Unknown ranking board'}), 404
+    
+    rows = leaderboard_index.around(character_id, board, leaderboard_radius())
+    if not rows:
+        return jsonify({'error': 'Character not ranked'}), 404
+    
+    column = BOARDS[board][0]
+    return jsonify([{
+        'rank': row['rank'],
+        'id': row['id'],
+        'name': row['name'],
+        'level': row['level'],
+        'faction': row['faction'],
+        'value': row[column]
+    } for row in rows])
+
+@game_bp.route('/rankings/<board>/around-me')
+@login_required
+@not_jailed
+def rankings_around_me(board):
+    if board not in BOARDS:
+        flash("Unknown ranking board", 'error')
+        return redirect(url_for('game.rankings'))
+    
+    return render_template('rankings_around.html',
+        translations=g.translations,
+        board=board,
+        boards=list(BOARDS),
+        column=BOARDS[board][0],
+        rows=leaderboard_index.around(current_user.character.id, board, leaderboard_radius())
+    )
     
 @game_bp.route('/battle-log/<int:battle_id>')
 @login_required
@@ -1132,6 +1089,8 @@ def battle_log(battle_id):
     
     return render_template('battle_log.html',
                          battle=battle,
+                         log_lines=render_stored_log(battle, g.translations,
+                                                     current_app.config.get('BATTLE_REPLAY_CACHE_TTL', 3600)),
                          translations=g.translations)
 
 @game_bp.route('/process-fight/<int:opponent_id>', methods=['POST'])
@@ -1146,8 +1105,6 @@ def process_fight(opponent_id):
         flash("You need at least 1 resource to attack!", 'error')
         return redirect(url_for('game.view_character', character_id=opponent_id))
     
-    attacker.resource -= 1    
-    
     if opponent_id == current_user.character.id:
         flash("Are you trying to hurt yourself? That is not allowed!", 'error')
         return redirect(url_for('game.dashboard'))
@@ -1167,263 +1124,36 @@ def process_fight(opponent_id):
         flash(f"{opponent.name} is already defeated!", 'error')
         return redirect(url_for('game.view_character', character_id=opponent_id))
     
-    existing_battle = BattleLog.query.filter(
-        ((BattleLog.attacker_id == current_user.character.id) & 
-         (BattleLog.defender_id == opponent.id)) | 
-        ((BattleLog.attacker_id == opponent.id) & 
-         (BattleLog.defender_id == current_user.character.id))
-    ).order_by(BattleLog.timestamp.desc()).first()
-    
-    if existing_battle:
-        if existing_battle.winner_id:
-            time_since_battle = (datetime.utcnow() - existing_battle.timestamp).total_seconds()
-            if time_since_battle < 300:
-                flash(f"You recently battled {opponent.name}. Please wait before fighting again.", 'error')
-                return redirect(url_for('game.view_character', character_id=opponent_id))
-        else:
-            flash("You already have an ongoing battle with this opponent!", 'error')
-            return redirect(url_for('game.view_character', character_id=opponent_id))
+    if pair_cooldowns.remaining(current_user.character.id, opponent.id):
+        flash(f"You recently battled {opponent.name}. Please wait before fighting again.", 'error')
+        return redirect(url_for('game.view_character', character_id=opponent_id))
     
-    fight_log = []
     attacker = current_user.character
     defender = opponent
-    
-    attacker_initial_rep = attacker.reputation
-    defender_initial_rep = defender.reputation
-    
-    same_faction = attacker.faction == defender.faction
-    enemy_faction = get_enemy_faction(attacker.faction) == defender.faction.lower()
-    
-    def calculate_defense(character):
-        defense = 0
-        if isinstance(character, NPC):
-            if character.armor and 'defense' in character.armor.stats:
-                defense = character.armor.stats['defense']
-        else:
-            for item in character.items:
-                if item.equipped and item.item.item_type == 'armor' and 'defense' in item.item.stats:
-                    defense += item.item.stats['defense']
-        return defense
-    
-    attacker_defense = calculate_defense(attacker)
-    defender_defense = calculate_defense(defender)
-    
-    def get_defense_chance(attacker, defender, is_defender_urghan):
-        base_chance = 5
-        
-        if is_defender_urghan:
-            base_chance = 15
-            
-        if attacker.forca > defender.forca:
-            if is_defender_urghan:
-                if attacker.faction.lower() == 'urghan':
-                    base_chance = 10
-                else:
-                    base_chance = 10
-            else:
-                base_chance = 10
-        elif attacker.forca == defender.forca:
-            if is_defender_urghan:
-                base_chance = 15
-            else:
-                base_chance = 5
-                
-        str_diff = abs(attacker.forca - defender.forca)
-        str_diff_bonus = (str_diff // 10) * 2
-        
-        if is_defender_urghan:
-            str_diff_bonus = min(str_diff_bonus, 40)
-        else:
-            str_diff_bonus = min(str_diff_bonus, 25)
-            
-        if defender.forca > attacker.forca:
-            base_chance += str_diff_bonus
-        else:
-            base_chance -= str_diff_bonus
-            
-        return max(0, min(base_chance, 95))
-    
-    is_defender_urghan = defender.faction.lower() == 'urghan'
-    defense_chance = get_defense_chance(attacker, defender, is_defender_urghan)
-    
-    def get_dodge_chance(character, opponent):
-        base_chance = 5
-        if character.faction.lower() == 'veylan':
-            base_chance = 10
-            
-        dex_diff = character.destreza - opponent.destreza
-        if dex_diff > 0:
-            dex_diff_bonus = (dex_diff // 10) * 2
-            
-            if character.faction.lower() == 'veylan':
-                dex_diff_bonus = min(dex_diff_bonus, 40)
-            else:
-                dex_diff_bonus = min(dex_diff_bonus, 25)
-                
-            base_chance += dex_diff_bonus
-            
-        return max(0, min(base_chance, 95))
-    
-    attacker_dodge = get_dodge_chance(attacker, defender)
-    defender_dodge = get_dodge_chance(defender, attacker)
-    
-    def get_crit_chance(character, opponent):
-        base_chance = 5
-        if character.faction.lower() == 'aureen':
-            base_chance = 10
-            
-        if character.inteligencia > opponent.inteligencia:
-            base_chance += 5
-            
-        int_diff = character.inteligencia - opponent.inteligencia
-        if int_diff > 0:
-            int_diff_bonus = (int_diff // 10) * (1 if character.faction.lower() == 'aureen' else 0.5)
-            
-            if character.faction.lower() == 'aureen':
-                int_diff_bonus = min(int_diff_bonus, 25)
-            else:
-                int_diff_bonus = min(int_diff_bonus, 20)
-                
-            base_chance += int_diff_bonus
-            
-        return max(0, min(base_chance, 95))
-    
-    attacker_crit = get_crit_chance(attacker, defender)
-    defender_crit = get_crit_chance(defender, attacker)
-    
-    def get_heal_chance(character, opponent):
-        base_chance = 2
-        if character.faction.lower() == 'camyra':
-            base_chance = 10
-            
-        if character.devocao > opponent.devocao:
-            base_chance += 5
-            
-        dev_diff = character.devocao - opponent.devocao
-        if dev_diff > 0:
-            dev_diff_bonus = (dev_diff // 10) * (1 if character.faction.lower() == 'camyra' else 0.5)
-            
-            if character.faction.lower() == 'camyra':
-                dev_diff_bonus = min(dev_diff_bonus, 30)
-            else:
-                dev_diff_bonus = min(dev_diff_bonus, 20)
-                
-            base_chance += dev_diff_bonus
-            
-        return max(0, min(base_chance, 95))
-    
-    attacker_heal = get_heal_chance(attacker, defender)
-    defender_heal = get_heal_chance(defender, attacker)
-    
-    attacker_first = attacker.destreza >= defender.destreza
-    
-    while True:
-        current_attacker = attacker if attacker_first else defender
-        current_defender = defender if attacker_first else attacker
-        
-        dodge_chance = attacker_dodge if current_attacker == attacker else defender_dodge
-        if random.random() < dodge_chance / 100:
-            fight_log.append(Markup(f"{current_defender.name} <span class='dodge'>dodged</span> {current_attacker.name}'s attack!"))
-            attacker_first = not attacker_first
-            continue
-            
-        damage, weapon_name = calculate_damage(current_attacker, current_defender)
-        
-        crit_chance = attacker_crit if current_attacker == attacker else defender_crit
-        is_crit = random.random() < crit_chance / 100
-        if is_crit:
-            base_damage = int(damage * 1.5)
-            
-        defense_chance = get_defense_chance(current_attacker, current_defender, current_defender.faction.lower() == 'urghan')
-        defense_amount = int(current_defender.forca + (defender_defense if current_defender == defender else attacker_defense))
-        is_blocked = random.random() < defense_chance / 100
-
-        if is_blocked:
-            damage = max(0, int(damage - defense_amount))
-            fight_log.append(Markup(f"{current_defender.name} <span class='block'>{'blocked' if damage == 0 else 'partially blocked'}</span> " f"{damage + defense_amount} damage (reduced by {int(defense_amount)})!"))
-            
-        if damage > 0:
-            attack_verb = "strikes" if weapon_name != "bare hands" else "hits"
-            if is_crit:
-                fight_log.append(Markup(f"{current_attacker.name} {attack_verb} {current_defender.name} with {weapon_name} for  " f"<span class='crit'>{damage} critical damage</span>!"))
-            else:
-                fight_log.append(Markup(f"{current_attacker.name} {attack_verb} {current_defender.name} with {weapon_name} for " f"<span class='damage'>{damage} damage</span>!"))
-            
-            current_defender.healthpoints = int(current_defender.healthpoints - damage)
-            
-            heal_chance = attacker_heal if current_defender == attacker else defender_heal
-            if random.random() < heal_chance / 100:
-                heal_percent = 0.1 
-                if current_defender.faction.lower() == 'camyra':
-                    dev_diff = current_defender.devocao - current_attacker.devocao
-                    heal_percent += min(0.5, (dev_diff // 10) * 0.01)
-                
-                heal_amount = int(current_defender.max_healthpoints * heal_percent)
-                current_defender.healthpoints = int(min(current_defender.max_healthpoints, current_defender.healthpoints + heal_amount))
-                fight_log.append(Markup(f"{current_defender.name} <span class='heal'>healed</span> for " f"<span class='heal-amount'>{heal_amount} HP</span>!"))
-        
-        if current_defender.healthpoints <= 0:
-            current_defender.healthpoints = 0
-            current_defender.is_dead = True
-            current_defender.deaths += 1
-            current_attacker.pvp_kills += 1
-            current_attacker.last_killed = current_defender
-            current_defender.last_killed_by = current_attacker
-
-            base_xp = random.randint(1, 100)
-            level_diff = current_defender.level - current_attacker.level
-            bonus_xp = max(0, level_diff) * 10
-            total_xp = base_xp + bonus_xp
-            current_attacker.add_xp(total_xp)
-            
-            gold_loss = min(current_defender.gold, int(current_defender.gold * 0.05))  # 5% of on-hand gold
-            current_defender.gold -= gold_loss
-            current_attacker.gold += gold_loss
-            
-            fight_log.append(f"{current_attacker.name} has defeated {current_defender.name} and gained {total_xp} XP!")
-            winner = current_attacker
-            
-            if same_faction:
-                if winner == attacker:
-                    attacker.reputation -= 4
-                else:
-                    attacker.reputation -= 4
-                    defender.reputation += 4
-            elif enemy_faction:
-                if winner == attacker:
-                    attacker.reputation += 3
-                    defender.reputation -= 3
-                else:
-                    attacker.reputation -= 3
-                    defender.reputation += 3
-            else:
-                if winner == attacker:
-                    attacker.reputation += 1
-                    defender.reputation -= 1
-                else:
-                    attacker.reputation -= 1
-                    defender.reputation += 1
-    
-            break
-
-        attacker_first = not attacker_first
-    
-    attacker.last_fight_time = datetime.utcnow()
-    
-    attacker_rep_change = attacker.reputation - attacker_initial_rep
-    defender_rep_change = defender.reputation - defender_initial_rep
-    
-    original_log = []
-    for entry in fight_log:
-        original_entry = entry.replace("You", attacker.name if "You hit" in entry else defender.name)
-        original_entry = original_entry.replace("you", defender.name if "hits you" in original_entry else attacker.name)
-        original_log.append(original_entry)
+    attacker_snapshot = Combatant.from_character(attacker)
+    defender_snapshot = Combatant.from_character(defender)
+    # Charged after the snapshots have loaded everything, so no autoflush
+    # sends it ahead of the attacker's single UPDATE
+    attacker.resource -= 1
+    weapons = (attacker_snapshot.weapon_name, defender_snapshot.weapon_name)
+    max_rounds = current_app.config.get('FIGHT_MAX_ROUNDS', 200)
+    log_rounds = current_app.config.get('FIGHT_LOG_ROUNDS', 50)
+    seed = new_seed()
+    record = replay_record(seed, attacker_snapshot, defender_snapshot, max_rounds, log_rounds)
+    result = resolve_pvp(attacker_snapshot, defender_snapshot, rng=random.Random(seed),
+                         max_rounds=max_rounds, log_rounds=log_rounds)
+    winner = apply_pvp_result(attacker, defender, result)
+    
+    total_xp = result.xp
+    gold_loss = result.gold
+    attacker_rep_change = result.attacker_rep_change
+    defender_rep_change = result.defender_rep_change
     
     battle = BattleLog(
         attacker_id=attacker.id,
         defender_id=defender.id,
         winner_id=winner.id,
-        log=original_log,
+        log=record,
         attacker_name=attacker.name,
         defender_name=defender.name,
         winner_name=winner.name,
@@ -1442,34 +1172,19 @@ def process_fight(opponent_id):
     
     db.session.add(battle)
     db.session.flush()
+    send_battle_notices(battle, attacker, defender)
+    battle_id, fought_at = battle.id, battle.timestamp
+    fight_log = render_events(result.events, (attacker.name, defender.name), weapons, g.translations)
+    db.session.commit()
+    pair_cooldowns.record(attacker_snapshot.id, defender_snapshot.id, fought_at)
     
-    attacker_message = Message(
-        sender_id=winner.id,
-        recipient_id=attacker.id,
-        subject=f"Battle Result vs {defender.name}",
-        body=f"You {'won' if winner == attacker else 'lost'} the battle against {defender.name}.\n\n" +
-             f"View battle log: {url_for('game.battle_log', battle_id=battle.id, _external=True)}"
-    )
-    
-    defender_message = Message(
-        sender_id=winner.id,
-        recipient_id=defender.id,
-        subject=f"Battle Result vs {attacker.name}",
-        body=f"You {'won' if winner == defender else 'lost'} the battle against {attacker.name}.\n\n" +
-             f"View battle log: {url_for('game.battle_log', battle_id=battle.id, _external=True)}"
-    )
-    
-    db.session.add(attacker_message)
-    db.session.add(defender_message)
-    db.session.commit()    
-     
     return render_template('fight_result.html',
                          translations=g.translations,
                          fight_log=fight_log,
                          winner=winner,
                          current_user=current_user,
                          opponent=opponent,
-                         battle_id=battle.id,
+                         battle_id=battle_id,
                          attacker_rep_change=attacker_rep_change,
                          defender_rep_change=defender_rep_change,
                          gold_loss=gold_loss
@@ -1479,10 +1194,10 @@ def process_fight(opponent_id):
 @login_required
 @not_jailed
 def my_battles():
-    battles = BattleLog.query.filter(
-        (BattleLog.attacker_id == current_user.character.id) |
-        (BattleLog.defender_id == current_user.character.id)
-    ).order_by(BattleLog.timestamp.desc()).all()
+    battles = battle_page(current_user.character.id,
+                          before=request.args.get('before'),
+                          after=request.args.get('after'),
+                          per_page=25)
     
     return render_template('my_battles.html',
                          battles=battles,
@@ -1618,6 +1333,7 @@ def equip_item(item_id):
                 ci.equipped = False
     
     character_item.equipped = True
+    character.invalidate_combat_stats()
     
     if item.item_type == 'armor' and 'health_bonus' in item.stats:
         character.healthpoints = min(character.healthpoints, character.max_healthpoints)
@@ -1645,6 +1361,7 @@ def unequip_item(item_id):
     
     if character_item.equipped:
         character_item.equipped = False
+        character.invalidate_combat_stats()
         
         if item.item_type == 'armor' and 'health_bonus' in item.stats:
             character.healthpoints = min(character.healthpoints, character.max_healthpoints)
@@ -1677,6 +1394,7 @@ def sell_item(item_id):
     
     character.gold += sell_price
     db.session.delete(character_item)
+    character.invalidate_combat_stats()
     db.session.commit()
     
     flash(g.translations['shop']['sell_success'], 'success')
@@ -1715,53 +1433,6 @@ def manage_items():
     current_lang = get_current_language()
     g.translations = load_translations(current_lang)
     
-    if not isinstance(g.translations, dict):
-        g.translations = {}
-    
-    if 'game' not in g.translations or not isinstance(g.translations['game'], dict):
-        g.translations['game'] = {}
-    
-    if 'items' not in g.translations['game']:
-        g.translations['game']['items'] = {
-            'weapon': {},
-            'armor': {
-                'head': {},
-                'body': {},
-                'gloves': {},
-                'pants': {},
-                'boots': {}
-            }
-        }
-    elif callable(g.translations['game']['items']):
-        g.translations['game']['items'] = g.translations['game']['items']()
-    elif not isinstance(g.translations['game']['items'], dict):
-        g.translations['game']['items'] = {
-            'weapon': {},
-            'armor': {
-                'head': {},
-                'body': {},
-                'gloves': {},
-                'pants': {},
-                'boots': {}
-            }
-        }
-    
-    if 'weapon' not in g.translations['game']['items'] or not isinstance(g.translations['game']['items']['weapon'], dict):
-        g.translations['game']['items']['weapon'] = {}
-    
-    if 'armor' not in g.translations['game']['items'] or not isinstance(g.translations['game']['items']['armor'], dict):
-        g.translations['game']['items']['armor'] = {
-            'head': {},
-            'body': {},
-            'gloves': {},
-            'pants': {},
-            'boots': {}
-        }
-    
-    for slot in ['head', 'body', 'gloves', 'pants', 'boots']:
-        if slot not in g.translations['game']['items']['armor'] or not isinstance(g.translations['game']['items']['armor'][slot], dict):
-            g.translations['game']['items']['armor'][slot] = {}
-    
     items = Item.query.order_by(Item.item_type, Item.min_level).all()
     return render_template('admin_items.html',
                         translations=g.translations,
@@ -1871,11 +1542,8 @@ def edit_item(item_id):
     
     dice_count = 1
     dice_type = 6
-    if item.item_type == 'weapon' and 'damage' in item.stats:
-        damage_parts = item.stats['damage'].split('d')
-        if len(damage_parts) == 2:
-            dice_count = int(damage_parts[0])
-            dice_type = int(damage_parts[1])
+    if item.item_type == 'weapon' and item.dice:
+        dice_count, dice_type = item.dice
     
     return render_template('admin_edit_item.html',
                          translations=g.translations,
@@ -1914,6 +1582,7 @@ def update_item_translations(item):
         
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(translations, f, ensure_ascii=False, indent=4)
+        catalog.invalidate(lang)
             
     except Exception as e:
         current_app.logger.error(f"Failed to update translations: {str(e)}")
@@ -1944,6 +1613,7 @@ def remove_item_translation(translation_key, item_type):
         
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(translations, f, ensure_ascii=False, indent=4)
+        catalog.invalidate(lang)
             
     except Exception as e:
         current_app.logger.error(f"Failed to remove translation: {str(e)}")
@@ -2031,10 +1701,7 @@ def edit_user(user_id):
     last_killed_by_battle = None
     
     if user.character:
-        battle_logs = BattleLog.query.filter(
-            (BattleLog.attacker_id == user.character.id) |
-            (BattleLog.defender_id == user.character.id)
-        ).order_by(BattleLog.timestamp.desc()).limit(10).all()
+        battle_logs = battle_page(user.character.id, per_page=10).items
         
         last_killed_battle = BattleLog.query.filter(
             BattleLog.attacker_id == user.character.id,
@@ -2247,6 +1914,7 @@ def update_quest_translations(quest, form_data):
         
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(translations, f, ensure_ascii=False, indent=4)
+        catalog.invalidate(lang)
             
     except Exception as e:
         current_app.logger.error(f"Failed to update quest translations: {str(e)}")
@@ -2402,6 +2070,7 @@ def remove_quest_translation(translation_key):
         
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(translations, f, ensure_ascii=False, indent=4)
+        catalog.invalidate(lang)
             
     except Exception as e:
         current_app.logger.error(f"Failed to remove quest translation: {str(e)}")
@@ -2440,13 +2109,6 @@ def armor_shop():
     current_lang = get_current_language()
     translations = load_translations(current_lang)
     
-    if 'game' not in g.translations:
-        g.translations['game'] = {}
-    if 'items' not in g.translations['game']:
-        g.translations['game']['items'] = {'armor': {
-            'head': {}, 'body': {}, 'gloves': {}, 'pants': {}, 'boots': {}
-        }}
-    
     armor = Item.query.filter_by(item_type='armor', is_npc_only=False).all()
     
     equipped_items = {item.item_id for item in current_user.character.items if item.equipped}
@@ -2473,11 +2135,30 @@ def delete_account():
         if character:
             current_app.logger.info(f"Deleting character {character.id} and associated data")
             
+            # A bulk delete skips the Message hooks, so stage the unread counter changes here
+            unread = db.session.query(Message.recipient_id, db.func.count(Message.id)).filter(
+                (Message.sender_id == character.id) | 
+                (Message.recipient_id == character.id),
+                Message.is_read == False,
+                Message.expires_at > datetime.utcnow()
+            ).group_by(Message.recipient_id).all()
+            for recipient_id, count in unread:
+                stage_unread_delta(db.session, recipient_id, -count)
+            
             Message.query.filter(
                 (Message.sender_id == character.id) | 
                 (Message.recipient_id == character.id)
             ).delete(synchronize_session=False)
             
+            deleted_battles = db.session.query(BattleLog.id).filter(
+                (BattleLog.attacker_id == character.id) | 
+                (BattleLog.defender_id == character.id) |
+                (BattleLog.winner_id == character.id)
+            )
+            # The opponents keep their notices, as plain text once the battle is gone
+            Message.query.filter(Message.battle_id.in_(deleted_battles)).update(
+                {Message.battle_id: None}, synchronize_session=False)
+            
             BattleLog.query.filter(
                 (BattleLog.attacker_id == character.id) | 
                 (BattleLog.defender_id == character.id) |
@@ -2803,15 +2484,6 @@ def academy():
                          resource_name=resource_name,
                          resources_to_use=resources_to_use)
                          
-def get_enemy_faction(faction):
-    enemy_factions = {
-        'veylan': 'urghan',
-        'urghan': 'aureen',
-        'aureen': 'camyra',
-        'camyra': 'veylan'
-    }
-    return enemy_factions.get(faction.lower())
-    
 def get_min_attackable_level(attacker_level):
     """Calculate the minimum level a player can attack based on their level"""
     if attacker_level <= 15:
@@ -2894,10 +2566,11 @@ def online_players():
     if not current_user.character:
         return redirect(url_for('game.dashboard'))
     
+    online_ids = presence.online_ids()
     online_users = User.query.filter(
-        User.last_activity > datetime.utcnow() - timedelta(minutes=5),
+        User.id.in_(online_ids),
         User.character != None
-    ).join(Character).order_by(Character.level.desc()).all()
+    ).join(Character).order_by(Character.level.desc()).all() if online_ids else []
     
     return render_template('online.html',
                          translations=g.translations,
@@ -3331,7 +3004,7 @@ def send_message():
     recipient_id = None
     parent_message_id = None
     parent_message = None
-    is_jailed_user = current_user.character.is_jailed if hasattr(current_user, 'character') else False
+    is_jailed_user = current_user_jailed()
 
     if request.method == 'POST':
         recipient_id = request.form.get('recipient_id', type=int)
@@ -3532,9 +3205,12 @@ def jail_character(character_id):
             else:  # minutes
                 total_minutes = duration
             
+            start_time = datetime.utcnow()
             jail = Jail(
                 character_id=character.id,
                 admin_id=current_user.character.id,
+                start_time=start_time,
+                jail_until=start_time + timedelta(minutes=total_minutes),
                 duration=total_minutes,
                 duration_unit=duration_unit,
                 real_reason=real_reason,
@@ -3546,6 +3222,7 @@ def jail_character(character_id):
             
             db.session.add(jail)
             db.session.commit()
+            jail_gate.jail(character.id, release_time(jail))
             
             flash(f"{character.name} has been jailed successfully", 'success')
             return redirect(url_for('game.view_character', character_id=character.id))
@@ -3562,7 +3239,7 @@ def jail_character(character_id):
 def jail():
     jailed_characters = Character.query.filter_by(is_jailed=True).all()
     
-    if current_user.character.is_jailed:
+    if current_user_jailed():
         jail_record = current_user.character.current_jail
         return render_template('jail.html',
                             translations=g.translations,
@@ -3581,21 +3258,7 @@ def jail():
 
 @game_bp.before_request
 def check_jailed():
-    if current_user.is_authenticated:
-        if request.endpoint == 'game.create_character':
-            return
-        
-        if not hasattr(current_user, 'character') or current_user.character is None:
-            return redirect(url_for('game.create_character'))
-        
-        if current_user.character.is_jailed:
-            jail_record = current_user.character.current_jail
-            if datetime.utcnow() > jail_record.start_time + timedelta(minutes=jail_record.duration):
-                current_user.character.is_jailed = False
-                jail_record.is_released = True
-                db.session.commit()
-            elif request.endpoint not in ['game.jail', 'game.mailbox', 'game.view_message', 'game.send_message']:
-                return redirect(url_for('game.jail'))
+    return jail_redirect(JAIL_ALLOWED_ENDPOINTS)
 
 @game_bp.route('/admin/release-jail/<int:character_id>', methods=['POST'])
 @login_required
@@ -3610,6 +3273,7 @@ def release_from_jail(character_id):
     character.is_jailed = False
     character.current_jail.is_released = True
     db.session.commit()
+    jail_gate.release(character.id)
     
     flash(f"{character.name} has been released from jail", 'success')
     return redirect(url_for('game.jail'))
@@ -3770,6 +3434,7 @@ def update_npc_translations(npc):
         
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(translations, f, ensure_ascii=False, indent=4)
+        catalog.invalidate(lang)
             
     except Exception as e:
         current_app.logger.error(f"Failed to update NPC translations: {str(e)}")
@@ -3791,6 +3456,7 @@ def remove_npc_translation(translation_key):
         
         with open(file_path, 'w', encoding='utf-8') as f:
             json.dump(translations, f, ensure_ascii=False, indent=4)
+        catalog.invalidate(lang)
             
     except Exception as e:
         current_app.logger.error(f"Failed to remove NPC translation: {str(e)}")
@@ -3846,38 +3512,57 @@ def fight_npc(npc_id):
             if character.armor and 'defense' in character.armor.stats:
                 defense = character.armor.stats['defense']
         else:
-            for item in character.items:
-                if item.equipped and item.item.item_type == 'armor' and 'defense' in item.item.stats:
-                    defense += item.item.stats['defense']
+            defense = character.combat_stats.defense
         return defense
     
     attacker_defense = calculate_defense(attacker)
     npc_defense = calculate_defense(npc)
     
-    attacker_first = True
+    npc_name = g.translations['game']['npcs'][npc.translation_key]['name']
+    max_rounds = current_app.config.get('FIGHT_MAX_ROUNDS', 200)
+    log_rounds = current_app.config.get('FIGHT_LOG_ROUNDS', 50)
+    rounds = 0
+    winner = None
     
-    while True:
+    while rounds < max_rounds:
+        rounds += 1
+        verbose = rounds <= log_rounds
+        
         damage, weapon_name = calculate_damage(attacker, npc)
         npc.healthpoints = max(0, npc.healthpoints - damage)
-        fight_log.append(Markup(f"{attacker.name} hits {g.translations['game']['npcs'][npc.translation_key]['name']} with {weapon_name} for <span class='damage'>{damage} damage</span>!"))
+        if verbose:
+            fight_log.append(Markup(f"{attacker.name} hits {npc_name} with {weapon_name} for <span class='damage'>{damage} damage</span>!"))
         
         if npc.healthpoints <= 0:
-            npc.healthpoints = 0
-            fight_log.append(f"{attacker.name} has defeated {g.translations['game']['npcs'][npc.translation_key]['name']}!")
             winner = "player"
             break
         
         damage, weapon_name = calculate_damage(npc, attacker)  # Simplified NPC damage
         attacker.healthpoints = max(0, attacker.healthpoints - damage)
-        fight_log.append(Markup(f"{g.translations['game']['npcs'][npc.translation_key]['name']} hits {attacker.name} for <span class='damage'>{damage} damage</span>!"))
+        if verbose:
+            fight_log.append(Markup(f"{npc_name} hits {attacker.name} for <span class='damage'>{damage} damage</span>!"))
         
         if attacker.healthpoints <= 0:
-            attacker.healthpoints = 0
-            attacker.is_dead = True
-            fight_log.append(f"{g.translations['game']['npcs'][npc.translation_key]['name']} has defeated {attacker.name}!")
             winner = "npc"
             break
     
+    if rounds > log_rounds:
+        fight_log.append(f"... {rounds - log_rounds} more rounds ...")
+    
+    if winner is None:
+        player_share = attacker.healthpoints / attacker.max_healthpoints if attacker.max_healthpoints else 0
+        npc_share = npc.healthpoints / npc.max_healthpoints if npc.max_healthpoints else 0
+        winner = "player" if player_share > npc_share else "npc"
+        fight_log.append(f"After {rounds} rounds {attacker.name if winner == 'player' else npc_name} is left standing with more health!")
+    
+    if winner == "player":
+        npc.healthpoints = 0
+        fight_log.append(f"{attacker.name} has defeated {npc_name}!")
+    else:
+        attacker.healthpoints = 0
+        attacker.is_dead = True
+        fight_log.append(f"{npc_name} has defeated {attacker.name}!")
+    
     heal_message = None
     if not attacker.is_dead and attacker.healthpoints < attacker.max_healthpoints:
         hp_needed = attacker.max_healthpoints - attacker.healthpoints
@@ -0,0 +1,94 @@
+import heapq
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from cache_helpers import cache
+
+JAIL_GENERATION_KEY = 'jail:generation'
+
+def release_time(jail):
+    return jail.jail_until or jail.start_time + timedelta(minutes=jail.duration or 0)
+
+class JailGate:
+    """In-memory set of jailed characters plus a min-heap of release times.
+
+    Answers "is this character jailed?" with a set lookup and no database
+    access; expired sentences drop out as soon as their release time passes,
+    without committing anything inside the request. jail/release bump a
+    generation token in the cache so every worker reloads its copy; the
+    token is read at most once every ``sync_seconds``. Other workers only
+    see the bump through a shared backend (SQLiteCache, Redis), not the
+    per-process SimpleCache.
+    """
+
+    def __init__(self, sync_seconds=5):
+        self._release_at = {}  # character_id -> release time
+        self._heap = []        # (release time, character_id); may hold stale entries
+        self._generation = None
+        self._next_sync = 0
+        self.sync_seconds = sync_seconds
+        self.loaded = False
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.sync_seconds = app.config.get('JAIL_SYNC_SECONDS', self.sync_seconds)
+
+    def load(self):
+        from database import db, Character, Jail
+        rows = db.session.query(Character.id, Jail).join(
+            Jail, Character.current_jail_id == Jail.id
+        ).filter(Character.is_jailed == True).all()
+        with self._lock:
+            self._release_at = {character_id: release_time(jail) for character_id, jail in rows}
+            self._heap = [(when, character_id) for character_id, when in self._release_at.items()]
+            heapq.heapify(self._heap)
+            self._generation = cache.get(JAIL_GENERATION_KEY)
+            self.loaded = True
+
+    def _sync(self):
+        now = time.monotonic()
+        if self.loaded and now < self._next_sync:
+            return
+        self._next_sync = now + self.sync_seconds
+        if not self.loaded or cache.get(JAIL_GENERATION_KEY) != self._generation:
+            self.load()
+
+    def _bump(self):
+        token = uuid.uuid4().hex
+        cache.set(JAIL_GENERATION_KEY, token, timeout=0)
+        self._generation = token
+
+    def _expire(self, now):
+        while self._heap and self._heap[0][0] <= now:
+            when, character_id = heapq.heappop(self._heap)
+            if self._release_at.get(character_id) == when:
+                del self._release_at[character_id]
+
+    def is_jailed(self, character_id, now=None):
+        self._sync()
+        with self._lock:
+            self._expire(now or datetime.utcnow())
+            return character_id in self._release_at
+
+    def release_at(self, character_id):
+        self._sync()
+        with self._lock:
+            return self._release_at.get(character_id)
+
+    def jail(self, character_id, release_at):
+        """Record a committed sentence"""
+        self._sync()
+        with self._lock:
+            self._release_at[character_id] = release_at
+            heapq.heappush(self._heap, (release_at, character_id))
+            self._bump()
+
+    def release(self, character_id):
+        """Record a committed release"""
+        self._sync()
+        with self._lock:
+            self._release_at.pop(character_id, None)
+            self._bump()
+
+jail_gate = JailGate()
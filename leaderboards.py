@@ -0,0 +1,243 @@
+import threading
+from sortedcontainers import SortedList
+from factions import faction_registry
+
+# board name -> (Character column, highest first?)
+BOARDS = {
+    'xp': ('current_xp', True),
+    'level': ('level', True),
+    'kills': ('pvp_kills', True),
+    'deaths': ('deaths', True),
+    'reputation': ('reputation', True),
+    'worst_reputation': ('reputation', False),
+    'gold': ('gold', True),
+    'bank_gold': ('bank_gold', True),
+    'mining_level': ('mining_level', True),
+    'diamonds': ('diamonds', True),
+    'forca': ('forca', True),
+    'destreza': ('destreza', True),
+    'inteligencia': ('inteligencia', True),
+    'devocao': ('devocao', True),
+    'combined': ('combined', True),
+}
+
+ATTRIBUTES = ('forca', 'destreza', 'inteligencia', 'devocao')
+
+# Row fields that aren't Character columns -> the columns they're computed from
+DERIVED_FIELDS = {'combined': ATTRIBUTES}
+
+RANKED_COLUMNS = sorted({column for field, _ in BOARDS.values()
+                         for column in DERIVED_FIELDS.get(field, (field,))})
+
+# Every Character column that feeds a player row; updates touching none of
+# these can't move anybody on any board
+ROW_COLUMNS = frozenset(RANKED_COLUMNS) | {'name', 'faction'}
+
+def player_row(character):
+    """The per-player entry shown on every leaderboard"""
+    attributes = {attr: getattr(character, attr) or 0 for attr in ATTRIBUTES}
+    return {
+        'id': character.id,
+        'name': character.name,
+        'level': character.level or 0,
+        'current_xp': character.current_xp or 0,
+        'pvp_kills': character.pvp_kills or 0,
+        'deaths': character.deaths or 0,
+        'reputation': character.reputation or 0,
+        'faction': character.faction,
+        'faction_color': faction_registry.color(character.faction),
+        'faction_image': faction_registry.image(character.faction),
+        'gold': character.gold or 0,
+        'bank_gold': character.bank_gold or 0,
+        'mining_level': character.mining_level or 0,
+        'diamonds': character.diamonds or 0,
+        **attributes,
+        'combined': sum(attributes.values())
+    }
+
+class Leaderboard:
+    """One ranking dimension, kept sorted by (-value, name, id)"""
+
+    def __init__(self, column, descending=True):
+        self.column = column
+        self.descending = descending
+        self._sorted = SortedList()
+        self._keys = {}
+
+    def key_for(self, row):
+        value = row[self.column]
+        return (-value if self.descending else value, row['name'], row['id'])
+
+    def load(self, rows):
+        self._keys = {row['id']: self.key_for(row) for row in rows}
+        self._sorted = SortedList(self._keys.values())
+
+    def update(self, row):
+        """Insert or move one player, O(log n)"""
+        key = self.key_for(row)
+        old_key = self._keys.get(row['id'])
+        if old_key == key:
+            return
+        if old_key is not None:
+            self._sorted.remove(old_key)
+        self._sorted.add(key)
+        self._keys[row['id']] = key
+
+    def remove(self, character_id):
+        old_key = self._keys.pop(character_id, None)
+        if old_key is not None:
+            self._sorted.remove(old_key)
+
+    def rank_of(self, character_id):
+        """1-based position of a player, O(log n); None if not ranked"""
+        key = self._keys.get(character_id)
+        if key is None:
+            return None
+        return self._sorted.index(key) + 1
+
+    def ids(self, start=0, stop=None):
+        return [key[2] for key in self._sorted.islice(start, stop)]
+
+    def around(self, character_id, radius):
+        """(first rank, ids) of the players up to ``radius`` places either side"""
+        rank = self.rank_of(character_id)
+        if rank is None:
+            return None, []
+        start = max(rank - 1 - radius, 0)
+        return start + 1, self.ids(start, rank + radius)
+
+    def __len__(self):
+        return len(self._sorted)
+
+def _order_column(field):
+    from database import db, Character
+    columns = [getattr(Character, column) for column in DERIVED_FIELDS.get(field, (field,))]
+    return sum((db.func.coalesce(column, 0) for column in columns[1:]),
+               db.func.coalesce(columns[0], 0))
+
+def query_top(board, limit):
+    """Top ``limit`` player rows of a board, straight from the database"""
+    from database import Character
+    field, descending = BOARDS[board]
+    value = _order_column(field)
+    characters = Character.query.order_by(
+        value.desc() if descending else value.asc(), Character.name, Character.id
+    ).limit(limit).all()
+    return [player_row(c) for c in characters]
+
+def query_faction_totals():
+    """{faction: {'kills', 'deaths', 'count'}} counted by the database"""
+    from database import db, Character
+    rows = db.session.query(
+        Character.faction,
+        db.func.sum(db.func.coalesce(Character.pvp_kills, 0)),
+        db.func.sum(db.func.coalesce(Character.deaths, 0)),
+        db.func.count(Character.id)
+    ).group_by(Character.faction).all()
+    return {faction: {'kills': int(kills), 'deaths': int(deaths), 'count': count}
+            for faction, kills, deaths, count in rows}
+
+class LeaderboardIndex:
+    """Per-process ordered index over every ranking dimension.
+
+    Loaded from the database by the scheduler (at startup and every
+    LEADERBOARD_RESYNC_MINUTES), then kept current by the Character commit
+    hooks in database.py, so a player's rank or neighbours cost O(log n) per
+    board instead of a full re-sort. A reload builds its copy outside the
+    lock, from plain column rows, and replays the changes that arrived
+    meanwhile before swapping it in, so lookups never wait on it. It only
+    sees this process's writes between reloads, so it is a read accelerator
+    for rank lookups only; the shared rankings snapshot is built from the
+    database (see query_top).
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.boards = self._new_boards()
+        self.loaded = False
+        self._lock = threading.RLock()
+        self._reload_lock = threading.Lock()
+        self._pending = None  # (character_id, row or None) seen while a reload builds its copy
+
+    @staticmethod
+    def _new_boards():
+        return {name: Leaderboard(column, descending) for name, (column, descending) in BOARDS.items()}
+
+    @staticmethod
+    def _apply_to(rows, boards, row):
+        rows[row['id']] = row
+        for board in boards.values():
+            board.update(row)
+
+    @staticmethod
+    def _discard_from(rows, boards, character_id):
+        rows.pop(character_id, None)
+        for board in boards.values():
+            board.remove(character_id)
+
+    def _swap(self, rows):
+        new_rows = {row['id']: row for row in rows}
+        boards = self._new_boards()
+        for board in boards.values():
+            board.load(new_rows.values())
+        with self._lock:
+            for character_id, row in self._pending:
+                if row is None:
+                    self._discard_from(new_rows, boards, character_id)
+                else:
+                    self._apply_to(new_rows, boards, row)
+            self.rows, self.boards = new_rows, boards
+            self.loaded = True
+
+    def reload(self):
+        """Reload from the database; meant for the scheduler, never a request thread"""
+        from database import db, Character
+        columns = [getattr(Character, column) for column in ('id', *sorted(ROW_COLUMNS))]
+        with self._reload_lock:
+            # Buffer from before the query so no commit falls between it and the swap
+            with self._lock:
+                self._pending = []
+            try:
+                self._swap([player_row(row) for row in db.session.query(*columns)])
+            finally:
+                with self._lock:
+                    self._pending = None
+
+    def apply(self, row):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((row['id'], row))
+            if self.loaded:
+                self._apply_to(self.rows, self.boards, row)
+
+    def discard(self, character_id):
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((character_id, None))
+            if self.loaded:
+                self._discard_from(self.rows, self.boards, character_id)
+
+    def rank_of(self, character_id, board):
+        with self._lock:
+            return self.boards[board].rank_of(character_id)
+
+    def ranks_of(self, character_id, boards=('xp', 'level', 'kills', 'deaths')):
+        with self._lock:
+            return {board: self.boards[board].rank_of(character_id) for board in boards}
+
+    def around(self, character_id, board, radius=5):
+        """Rows of the players ranked just above and below a character.
+
+        Each row is a copy carrying its 1-based ``rank``; the slice is cut
+        straight out of the sorted board, so the cost doesn't grow with the
+        number of players.
+        """
+        with self._lock:
+            first, ids = self.boards[board].around(character_id, radius)
+            return [dict(self.rows[i], rank=first + offset) for offset, i in enumerate(ids)]
+
+leaderboard_index = LeaderboardIndex()
+
+def rank_of(character_id, board):
+    """Rank of a character on a board (see BOARDS), O(log n)"""
+    return leaderboard_index.rank_of(character_id, board)
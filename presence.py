@@ -0,0 +1,101 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+class PresenceTracker:
+    """Write-behind record of when each user was last active.
+
+    Requests only touch an in-memory dict; ``flush`` (run by the scheduler
+    every PRESENCE_FLUSH_SECONDS) writes the batch back to
+    ``User.last_activity`` with one bulk UPDATE. Online lookups come from the
+    sliding window kept here, merged with users the other workers have
+    flushed, which is re-read once per flush instead of once per request.
+    """
+
+    def __init__(self, window=300, flush_interval=30):
+        self.window = window
+        self.flush_interval = flush_interval
+        self._seen = {}     # user_id -> last activity seen by this process
+        self._pending = {}  # user_id -> activity not written to the database yet
+        self._remote = {}   # user_id -> last activity flushed by any worker
+        self._remote_loaded_at = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.window = app.config.get('PRESENCE_WINDOW_SECONDS', self.window)
+        self.flush_interval = app.config.get('PRESENCE_FLUSH_SECONDS', self.flush_interval)
+
+    def touch(self, user_id, when=None, has_character=True):
+        """Record activity; users without a character are written back but never listed online"""
+        when = when or datetime.utcnow()
+        with self._lock:
+            if has_character:
+                self._seen[user_id] = when
+            self._pending[user_id] = when
+
+    def discard(self, user_id):
+        """Stop listing a user whose character or account was deleted"""
+        with self._lock:
+            self._seen.pop(user_id, None)
+            self._remote.pop(user_id, None)
+
+    def last_seen(self, user_id):
+        with self._lock:
+            local = self._seen.get(user_id)
+            remote = self._remote.get(user_id)
+        if local and remote:
+            return max(local, remote)
+        return local or remote
+
+    def flush(self):
+        """Write pending activity with a single bulk UPDATE; returns rows written"""
+        from flask import current_app
+        from database import db, User
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if pending:
+            try:
+                db.session.execute(db.update(User), [
+                    {'id': user_id, 'last_activity': when} for user_id, when in pending.items()
+                ])
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                with self._lock:
+                    for user_id, when in pending.items():
+                        self._pending.setdefault(user_id, when)
+                current_app.logger.exception("Presence flush failed")
+                return 0
+        self._load_remote()
+        return len(pending)
+
+    def _load_remote(self):
+        from database import db, User
+        cutoff = datetime.utcnow() - timedelta(seconds=self.window)
+        rows = db.session.query(User.id, User.last_activity).filter(
+            User.last_activity > cutoff,
+            User.character != None
+        ).all()
+        with self._lock:
+            self._remote = dict(rows)
+            self._remote_loaded_at = time.monotonic()
+
+    def online_ids(self):
+        """Ids of users active within the window, most recently active first"""
+        if self._remote_loaded_at is None or time.monotonic() - self._remote_loaded_at > self.flush_interval:
+            self._load_remote()
+        cutoff = datetime.utcnow() - timedelta(seconds=self.window)
+        with self._lock:
+            for user_id in [u for u, when in self._seen.items() if when <= cutoff]:
+                del self._seen[user_id]
+            merged = dict(self._remote)
+            for user_id, when in self._seen.items():
+                if merged.get(user_id) is None or when > merged[user_id]:
+                    merged[user_id] = when
+        return [user_id for user_id, when in sorted(merged.items(), key=lambda item: item[1], reverse=True)
+                if when > cutoff]
+
+    def online_count(self):
+        return len(self.online_ids())
+
+presence = PresenceTracker()
@@ -0,0 +1,196 @@
+import hashlib
+import numpy as np
+from cache_helpers import cache
+from combat import defense_chance, dodge_chance, heal_chance
+
+DEFAULT_MAX_ROUNDS = 200
+
+class SimulationReport:
+    """Summary of a batch of simulated fights, seen from the attacker's side"""
+
+    __slots__ = ('fights', 'wins', 'losses', 'tiebreaks', 'rounds',
+                 'damage_dealt', 'damage_taken')
+
+    def __init__(self, fights, wins, losses, tiebreaks, rounds, damage_dealt, damage_taken):
+        self.fights = fights
+        self.wins = wins
+        self.losses = losses
+        self.tiebreaks = tiebreaks
+        self.rounds = rounds
+        self.damage_dealt = damage_dealt
+        self.damage_taken = damage_taken
+
+    @property
+    def win_rate(self):
+        return self.wins / self.fights if self.fights else 0.0
+
+    @property
+    def expected_rounds(self):
+        return self.rounds['mean']
+
+    def as_dict(self):
+        return {
+            'fights': self.fights,
+            'wins': self.wins,
+            'losses': self.losses,
+            'tiebreaks': self.tiebreaks,
+            'win_rate': self.win_rate,
+            'rounds': self.rounds,
+            'damage_dealt': self.damage_dealt,
+            'damage_taken': self.damage_taken
+        }
+
+def distribution(values):
+    """Mean and percentiles of a 1-d array, as plain floats"""
+    if not len(values):
+        return {'mean': 0.0, 'p10': 0.0, 'p50': 0.0, 'p90': 0.0, 'max': 0.0}
+    p10, p50, p90 = np.percentile(values, [10, 50, 90])
+    return {'mean': float(values.mean()), 'p10': float(p10), 'p50': float(p50),
+            'p90': float(p90), 'max': float(values.max())}
+
+def roll_dice(rng, weapon_dice, size):
+    if not weapon_dice:
+        return np.zeros(size)
+    return weapon_dice.roll_many(rng, size)
+
+def _tiebreak(winner, active, hp, max_hp):
+    """Settle fights that ran out of rounds like combat.tiebreak_loser does"""
+    share = hp[:, active] / np.where(max_hp > 0, max_hp, np.inf)[:, None]
+    winner[active] = np.where(share[0] > share[1], 0, 1)
+    return active.size
+
+def _report(n, winner, tiebreaks, rounds, dealt, taken):
+    return SimulationReport(
+        fights=n,
+        wins=int((winner == 0).sum()),
+        losses=int((winner == 1).sum()),
+        tiebreaks=tiebreaks,
+        rounds=distribution(rounds),
+        damage_dealt=distribution(dealt),
+        damage_taken=distribution(taken)
+    )
+
+def simulate_pvp(attacker, defender, n=100000, seed=None, max_rounds=DEFAULT_MAX_ROUNDS):
+    """Run ``n`` PvP fights between two Combatants at once; returns a SimulationReport.
+
+    Mirrors combat.resolve_pvp: dodge, weapon dice, block, heal and the
+    turn order, with every fight advanced one swing per step in NumPy
+    arrays. Crits are left out because they don't change the damage.
+    Fights still running after ``max_rounds`` swings go to the side with
+    the larger share of its HP left, as in the live fights.
+    """
+    rng = np.random.default_rng(seed)
+    sides = (attacker, defender)
+
+    # Index 0 is the attacker, 1 the defender; chances belong to the swinging side
+    dodge = np.array([dodge_chance(c, sides[1 - i]) for i, c in enumerate(sides)]) / 100
+    block = np.array([defense_chance(c, sides[1 - i]) for i, c in enumerate(sides)]) / 100
+    heal = np.array([heal_chance(c, sides[1 - i]) for i, c in enumerate(sides)]) / 100
+    power_gap = np.array([max(0, c.power - sides[1 - i].power) for i, c in enumerate(sides)])
+    # ...while these belong to the side being hit
+    armor = np.array([int(c.forca + c.defense) for c in sides])
+    max_hp = np.array([c.max_hp for c in sides], dtype=float)
+    heal_amount = np.empty(2)
+    for i, c in enumerate(sides):
+        heal_percent = 0.1
+        if c.is_camyra:
+            heal_percent += min(0.5, ((c.devocao - sides[1 - i].devocao) // 10) * 0.01)
+        heal_amount[i] = int(c.max_hp * heal_percent)
+
+    hp = np.empty((2, n))
+    hp[0] = attacker.hp
+    hp[1] = defender.hp
+    swinger = np.full(n, 0 if attacker.destreza >= defender.destreza else 1)
+    winner = np.full(n, -1)
+    rounds = np.zeros(n, dtype=np.int64)
+    dealt = np.zeros((2, n))
+    active = np.arange(n)
+
+    for _ in range(max_rounds):
+        if not active.size:
+            break
+        m = active.size
+        s = swinger[active]
+        t = 1 - s
+        rounds[active] += 1
+
+        dodged = rng.random(m) < dodge[s]
+        weapon = np.where(s == 0, roll_dice(rng, attacker.weapon_dice, m),
+                          roll_dice(rng, defender.weapon_dice, m))
+        damage = np.trunc(power_gap[s] + weapon + rng.integers(1, 4, size=m))
+        blocked = rng.random(m) < block[s]
+        damage = np.where(blocked, np.maximum(0, np.trunc(damage - armor[t])), damage)
+        damage[dodged] = 0
+        landed = damage > 0
+        dealt[s, active] += damage
+
+        target_hp = hp[t, active]
+        target_hp = np.where(landed, np.minimum(np.trunc(target_hp - damage), max_hp[t]), target_hp)
+        healed = landed & (rng.random(m) < heal[t])
+        target_hp = np.where(healed, np.minimum(max_hp[t], target_hp + heal_amount[t]), target_hp)
+
+        dead = ~dodged & (target_hp <= 0)
+        hp[t, active] = np.where(dead, 0, target_hp)
+        winner[active[dead]] = s[dead]
+        swinger[active] = t
+        active = active[~dead]
+
+    tiebreaks = _tiebreak(winner, active, hp, max_hp)
+    return _report(n, winner, tiebreaks, rounds, dealt[0], dealt[1])
+
+def simulate_npc(character, npc, n=100000, seed=None, max_rounds=DEFAULT_MAX_ROUNDS):
+    """Run ``n`` fights between a character and an NPC, both Combatants.
+
+    Mirrors the fight_npc route: the character always swings first,
+    neither side dodges, blocks, crits or heals, and a round is one swing
+    from each side.
+    """
+    rng = np.random.default_rng(seed)
+    sides = (character, npc)
+    power_gap = [max(0, c.power - sides[1 - i].power) for i, c in enumerate(sides)]
+    max_hp = np.array([c.max_hp for c in sides], dtype=float)
+
+    hp = np.empty((2, n))
+    hp[0] = character.hp
+    hp[1] = npc.hp
+    winner = np.full(n, -1)
+    rounds = np.zeros(n, dtype=np.int64)
+    dealt = np.zeros((2, n))
+    active = np.arange(n)
+
+    for step in range(2 * max_rounds):
+        if not active.size:
+            break
+        s = step % 2
+        t = 1 - s
+        m = active.size
+        if s == 0:
+            rounds[active] += 1
+
+        damage = np.trunc(power_gap[s] + roll_dice(rng, sides[s].weapon_dice, m)
+                          + rng.integers(1, 4, size=m))
+        dealt[s, active] += damage
+        target_hp = np.maximum(0, hp[t, active] - damage)
+        hp[t, active] = target_hp
+
+        dead = target_hp <= 0
+        winner[active[dead]] = s
+        active = active[~dead]
+
+    tiebreaks = _tiebreak(winner, active, hp, max_hp)
+    return _report(n, winner, tiebreaks, rounds, dealt[0], dealt[1])
+
+def _build_key(combatant):
+    return (combatant.faction, combatant.forca, combatant.destreza, combatant.inteligencia,
+            combatant.devocao, combatant.hp, combatant.max_hp, combatant.defense,
+            combatant.weapon_dice)
+
+def get_cached_odds(attacker, defender, n=2000, timeout=300, max_rounds=DEFAULT_MAX_ROUNDS):
+    """Win-probability preview for the fight page, cached per pair of builds"""
+    builds = repr((_build_key(attacker), _build_key(defender), n, max_rounds))
+    key = 'fight_odds:' + hashlib.sha1(builds.encode()).hexdigest()
+    report = cache.get(key)
+    if report is None:
+        report = simulate_pvp(attacker, defender, n=n, max_rounds=max_rounds)
+        cache.set(key, report, timeout=timeout)
+    return report
@@ -1,19 +1,31 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from apscheduler.schedulers.background import BackgroundScheduler
 from database import db, Message, Jail, Character, PlayerQuest
+from leaderboards import leaderboard_index
+from presence import presence
+from jails import jail_gate, release_time
+from cache_helpers import invalidate_rankings_cache, reconcile_unread_counts, reconcile_faction_totals
 
 def check_jail_expirations(app):
     """Release players whose jail time has expired"""
     with app.app_context(): # <--- ADDED
+        now = datetime.utcnow()
+        # Sentences from before jail_until existed get it filled in once
+        for jail in Jail.query.filter(Jail.is_released == False, Jail.jail_until == None):
+            jail.jail_until = release_time(jail)
+        
         expired_jails = Jail.query.filter(
             Jail.is_released == False,
-            db.func.datetime(Jail.start_time + db.func.cast(Jail.duration, db.Interval) * 60) <= datetime.utcnow()
+            Jail.jail_until <= now
         ).all()
         
         for jail in expired_jails:
             jail.character.is_jailed = False
             jail.is_released = True
         db.session.commit()
+        
+        for jail in expired_jails:
+            jail_gate.release(jail.character_id)
 
 def reset_daily_quests(app):
     """Reset all daily quests (mark failed if not completed)"""
@@ -102,6 +114,27 @@ def cleanup_expired_messages(app):
         
         db.session.commit()
 
+def resync_leaderboards(app):
+    """Reload the leaderboard index to pick up writes made by other workers"""
+    with app.app_context():
+        leaderboard_index.reload()
+        fixed = reconcile_faction_totals()
+        if fixed:
+            print(f"Reconciled {fixed} faction counters")
+        invalidate_rankings_cache()
+
+def reconcile_unread_messages(app):
+    """Correct unread counters that drifted, e.g. from messages that expired"""
+    with app.app_context():
+        fixed = reconcile_unread_counts()
+        if fixed:
+            print(f"Reconciled {fixed} unread message counters")
+
+def flush_presence(app):
+    """Write buffered last_activity timestamps back in one batch"""
+    with app.app_context():
+        presence.flush()
+
 def init_scheduler(app):
     scheduler = BackgroundScheduler(timezone="UTC")
     
@@ -129,7 +162,12 @@ def init_scheduler(app):
     
     # Other jobs
     scheduler.add_job(func=lambda: cleanup_expired_messages(app), trigger="interval", hours=24) # <--- MODIFIED
-    scheduler.add_job(func=lambda: check_jail_expirations(app), trigger="interval", minutes=5) # <--- MODIFIED
+    scheduler.add_job(func=lambda: check_jail_expirations(app), trigger="interval", minutes=app.config.get('JAIL_RELEASE_CHECK_MINUTES', 1))
+    # First run straight away, so the leaderboard index is never loaded on a request thread
+    scheduler.add_job(func=lambda: resync_leaderboards(app), trigger="interval", minutes=app.config.get('LEADERBOARD_RESYNC_MINUTES', 10),
+                      next_run_time=datetime.now(timezone.utc))
+    scheduler.add_job(func=lambda: reconcile_unread_messages(app), trigger="interval", minutes=app.config.get('UNREAD_RECONCILE_MINUTES', 60))
+    scheduler.add_job(func=lambda: flush_presence(app), trigger="interval", seconds=app.config.get('PRESENCE_FLUSH_SECONDS', 30))
     
     scheduler.start()
     return scheduler
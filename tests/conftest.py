@@ -0,0 +1,51 @@
+import pytest
+from sqlalchemy import event
+import config
+from app import create_app
+from cache_helpers import cache
+from database import db, Character
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(config.Config, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp_path / 'game.db'}")
+    monkeypatch.setattr(config.Config, 'CACHE_TYPE', 'SimpleCache')
+    app = create_app()
+    app.config['TESTING'] = True
+    with app.app_context():
+        db.create_all()
+        cache.clear()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def make_player(app):
+    """Sign up and create a character; returns (logged-in client, character id)"""
+    def make(username, faction):
+        client = app.test_client()
+        client.post('/signup', data={'username': username, 'password': 'pw'})
+        client.post('/create-character', data={'character_name': username.title(), 'faction': faction})
+        with app.app_context():
+            character = Character.query.filter_by(name=username.title()).one()
+            return client, character.id
+    return make
+
+
+def count_statements(app, action):
+    """SQL statements run while ``action()`` executes, and its return value"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        result = action()
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return statements, result
@@ -0,0 +1,31 @@
+from conftest import count_statements
+
+# Statements one PvP fight may run, reads included; 10 since battle notices
+# became a single bulk INSERT
+FIGHT_STATEMENT_BUDGET = 10
+
+
+def test_pvp_fight_statement_budget(app, make_player):
+    attacker, _ = make_player('alice', 'Veylan')
+    _, defender_id = make_player('bob', 'Urghan')
+    attacker.get('/dashboard')
+
+    statements, response = count_statements(app, lambda: attacker.post(f'/process-fight/{defender_id}'))
+
+    assert response.status_code == 200
+    assert len(statements) <= FIGHT_STATEMENT_BUDGET, '\n'.join(statements)
+    assert sum(s.lstrip().upper().startswith(('INSERT', 'UPDATE', 'DELETE')) for s in statements) <= 4
+
+
+def test_battle_notice_needs_battle_id(app, make_player):
+    sender, _ = make_player('alice', 'Veylan')
+    recipient, recipient_id = make_player('bob', 'Urghan')
+    sender.post('/message/send', data={'recipient_id': recipient_id, 'subject': 'Battle Result',
+                                        'body': 'battle:1'})
+
+    from database import Message
+    with app.app_context():
+        message = Message.query.filter_by(recipient_id=recipient_id, subject='Battle Result').one()
+        assert message.battle_id is None
+        response = recipient.get(f'/message/{message.id}')
+    assert b'View battle log' not in response.data
@@ -0,0 +1,45 @@
+import pytest
+from conftest import count_statements
+from database import db, Item, CharacterItem
+
+# Statements per request once the caches are warm; the principal (user,
+# character, equipped items and jail) is always exactly one of them
+PAGE_BUDGETS = {
+    '/dashboard': 1,
+    '/shop': 2,
+    '/mailbox': 2,
+    '/my-battles': 3,
+    '/rankings': 1,
+}
+
+
+@pytest.fixture
+def equipped_player(app, make_player):
+    client, character_id = make_player('alice', 'Veylan')
+    with app.app_context():
+        items = [Item(item_type='weapon', translation_key='iron_sword', price=10, stats={'damage': '2d6'}),
+                 Item(item_type='armor', armor_type='body', translation_key='leather_armor', price=10,
+                      stats={'defense': 2, 'health_bonus': 5})]
+        db.session.add_all(items)
+        db.session.flush()
+        db.session.add_all([CharacterItem(character_id=character_id, item_id=item.id) for item in items])
+        db.session.commit()
+        item_ids = [item.id for item in items]
+    for item_id in item_ids:
+        client.post(f'/equip-item/{item_id}')
+    with app.app_context():
+        assert CharacterItem.query.filter_by(character_id=character_id, equipped=True).count() == 2
+    return client
+
+
+@pytest.mark.parametrize('url', sorted(PAGE_BUDGETS))
+def test_page_query_budget(app, equipped_player, url):
+    equipped_player.get(url)
+
+    statements, response = count_statements(app, lambda: equipped_player.get(url))
+
+    assert response.status_code == 200
+    assert len(statements) <= PAGE_BUDGETS[url], '\n'.join(statements)
+    # No lazy loads of the principal's parts after the joined query
+    principal_tables = ('FROM users', 'FROM characters', 'FROM character_items', 'FROM jail')
+    assert sum(any(table in s for table in principal_tables) for s in statements) <= 1, '\n'.join(statements)
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import threading
+from types import MappingProxyType
+
+LOCALES_DIR = os.path.join(os.path.dirname(__file__), 'locales')
+
+TOP_LEVEL_FILES = ['auth', 'errors', 'forms', 'navigation', 'dashboard',
+                   'character_creation', 'authentication', 'lore', 'search',
+                   'fight', 'rankings', 'shop', 'admin']
+GAME_FILES = ['npcs', 'factions', 'attributes', 'academy', 'market', 'fights',
+              'arena', 'lottery', 'mine', 'bank', 'quests']
+ARMOR_SLOTS = ['head', 'body', 'gloves', 'pants', 'boots']
+
+def empty_translations():
+    """Skeleton every catalog starts from, so lookups never hit a missing section"""
+    return {
+        'general': {},
+        'auth': {},
+        'errors': {},
+        'forms': {},
+        'navigation': {},
+        'game': {
+            'items': {
+                'weapon': {},
+                'armor': {slot: {} for slot in ARMOR_SLOTS},
+                'magic': {}
+            },
+            'npcs': {},
+            'factions': {},
+            'attributes': {},
+            'academy': {},
+            'market': {},
+            'fights': {},
+            'arena': {},
+            'bank': {},
+            'mine': {},
+            'lottery': {},
+            'online': {},
+            'character_stats': {},
+            'buildings': [],
+            'quests': {
+                'attributes': {}
+            }
+        },
+        'dashboard': {},
+        'character_creation': {},
+        'authentication': {},
+        'lore': {},
+        'search': {},
+        'fight': {},
+        'rankings': {},
+        'shop': {},
+        'admin': {}
+    }
+
+def _read_json(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def build_translations(lang, locales_dir=LOCALES_DIR):
+    """Read every locale file of a language into a plain nested dict"""
+    translations = empty_translations()
+    base_path = os.path.join(locales_dir, lang)
+
+    if not os.path.isdir(base_path):
+        return translations
+
+    general_path = os.path.join(base_path, 'general.json')
+    if os.path.exists(general_path):
+        translations['general'] = _read_json(general_path)
+
+    for filename in TOP_LEVEL_FILES:
+        file_path = os.path.join(base_path, f"{filename}.json")
+        if os.path.exists(file_path):
+            translations[filename] = _read_json(file_path)
+
+    game_path = os.path.join(base_path, 'game')
+    if not os.path.isdir(game_path):
+        return translations
+
+    items_path = os.path.join(game_path, 'items')
+    weapon_path = os.path.join(items_path, 'weapons.json')
+    if os.path.exists(weapon_path):
+        translations['game']['items']['weapon'] = _read_json(weapon_path)
+
+    armor_path = os.path.join(items_path, 'armor.json')
+    if os.path.exists(armor_path):
+        armor_data = _read_json(armor_path)
+        for slot in ARMOR_SLOTS:
+            translations['game']['items']['armor'][slot] = armor_data.get(slot, {})
+
+    magic_path = os.path.join(items_path, 'magic.json')
+    if os.path.exists(magic_path):
+        translations['game']['items']['magic'] = _read_json(magic_path)
+
+    for filename in GAME_FILES:
+        file_path = os.path.join(game_path, f"{filename}.json")
+        if os.path.exists(file_path):
+            translations['game'][filename] = _read_json(file_path)
+
+    buildings_path = os.path.join(game_path, 'buildings.json')
+    if os.path.exists(buildings_path):
+        translations['game']['buildings'] = _read_json(buildings_path).get('buildings', [])
+
+    return translations
+
+def freeze(value):
+    """Recursively turn dicts into read-only mappings and lists into tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(freeze(item) for item in value)
+    return value
+
+class TranslationCatalog:
+    """Process-wide, read-only translations compiled once per language.
+
+    A language is rebuilt only when the mtimes of its locale files change.
+    The files are stat'ed at most once every ``check_interval`` seconds, so
+    a normal page view does no file I/O and no JSON decoding at all.
+    """
+
+    def __init__(self, locales_dir=LOCALES_DIR, check_interval=5):
+        self.locales_dir = locales_dir
+        self.check_interval = check_interval
+        self._entries = {}  # lang -> (translations, signature, checked_at)
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        self.locales_dir = os.path.join(app.root_path, 'locales')
+        self.check_interval = app.config.get('TRANSLATIONS_CHECK_INTERVAL', self.check_interval)
+        self.invalidate()
+
+    def _signature(self, lang):
+        base_path = os.path.join(self.locales_dir, lang)
+        signature = []
+        for root, _, files in os.walk(base_path):
+            for filename in files:
+                if filename.endswith('.json'):
+                    path = os.path.join(root, filename)
+                    try:
+                        signature.append((path, os.stat(path).st_mtime_ns))
+                    except OSError:
+                        continue
+        return tuple(sorted(signature))
+
+    def get(self, lang):
+        """Return the immutable translations mapping for a language"""
+        now = time.monotonic()
+        entry = self._entries.get(lang)
+        if entry is not None and now - entry[2] < self.check_interval:
+            return entry[0]
+
+        with self._lock:
+            entry = self._entries.get(lang)
+            if entry is not None and now - entry[2] < self.check_interval:
+                return entry[0]
+
+            signature = self._signature(lang)
+            if entry is not None and entry[1] == signature:
+                translations = entry[0]
+            else:
+                translations = freeze(build_translations(lang, self.locales_dir))
+            self._entries[lang] = (translations, signature, now)
+            return translations
+
+    def invalidate(self, lang=None):
+        """Drop compiled languages so the next lookup reloads them from disk"""
+        with self._lock:
+            if lang is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(lang, None)
+
+catalog = TranslationCatalog()